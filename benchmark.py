@@ -0,0 +1,291 @@
+# Headless benchmark for the enemy's planner. Builds maps exactly like Simulation does, replays a
+# scripted player and measures every replan the enemy makes. Nothing is drawn, so it runs on the
+# SDL dummy video driver and can go in CI.
+#
+#   python benchmark.py --seeds 10 --frames 1800 --output bench.json
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+
+import main
+from collision import CollisionMap
+from recording import KeyState
+
+FRAME_BUDGET_MS = 1000 / 60
+
+# Scripted players. Each one takes (frame, player position, seed) and returns the keys held that frame.
+
+def steer_towards(pos, target):
+    keys = []
+    if target[0] < pos.x - 3: keys.append(pygame.K_a)
+    if target[0] > pos.x + 3: keys.append(pygame.K_d)
+    if target[1] < pos.y - 3: keys.append(pygame.K_w)
+    if target[1] > pos.y + 3: keys.append(pygame.K_s)
+    return KeyState(keys)
+
+def idle(frame, pos, seed):
+    return KeyState()
+
+def orbit(frame, pos, seed):
+    angle = frame * 0.01
+    target = (main.WORLD_WIDTH / 2 + 350 * math.cos(angle), main.WORLD_HEIGHT / 2 + 220 * math.sin(angle))
+    return steer_towards(pos, target)
+
+def zigzag(frame, pos, seed):
+    horizontal = pygame.K_d if (frame // 120) % 2 == 0 else pygame.K_a
+    vertical = pygame.K_s if (frame // 40) % 2 == 0 else pygame.K_w
+    return KeyState((horizontal, vertical))
+
+def random_walk(frame, pos, seed):
+    # Holds a random direction for half a second at a time
+    rng = random.Random(seed * 100003 + frame // 30)
+    return KeyState(rng.sample((pygame.K_w, pygame.K_a, pygame.K_s, pygame.K_d), rng.randint(1, 2)))
+
+TRAJECTORIES = {
+    "idle": idle,
+    "orbit": orbit,
+    "zigzag": zigzag,
+    "random_walk": random_walk,
+}
+
+class CountingCollisionMap(CollisionMap):
+    """CollisionMap that counts its queries, kept out of the game so normal play doesn't pay for it"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checks = 0
+
+    def is_point_free(self, pos):
+        self.checks += 1
+        return super().is_point_free(pos)
+
+    def is_segment_free(self, start, end):
+        self.checks += 1
+        return super().is_segment_free(start, end)
+
+    def points_free(self, points):
+        self.checks += len(points)
+        return super().points_free(points)
+
+    def segments_free(self, starts, ends):
+        self.checks += len(starts)
+        return super().segments_free(starts, ends)
+
+class BenchmarkEnemy(main.Enemy):
+    """Enemy that records a row of stats for every replan"""
+    def __init__(self, x, y, collision_map):
+        super().__init__(x, y, collision_map)
+        self.plans = []
+        self.refine_iterations = 0
+
+    def replan(self, player_pos):
+        checks = self.collision_map.checks
+        start = time.perf_counter()
+        path = None
+        first_path_iterations = None
+        first_path_nodes = None
+        first_path_ms = None
+        for path in self.plan_steps(player_pos, self.refine_iterations):
+            if path and first_path_iterations is None:
+                first_path_ms = (time.perf_counter() - start) * 1000
+                first_path_iterations = self.planner.iterations
+                first_path_nodes = len(self.planner.tree.get_node_positions())
+        elapsed = time.perf_counter() - start
+
+        if path:
+            self.set_path(path)
+        self.plans.append({
+            "latency_ms": elapsed * 1000,
+            "first_path_ms": first_path_ms,
+            "found": bool(path),
+            "iterations": self.planner.iterations,
+            "iterations_to_first_path": first_path_iterations,
+            "nodes_to_first_path": first_path_nodes,
+            "collision_checks": self.collision_map.checks - checks,
+            "path_cost": main.path_length(path) if path else None,
+        })
+
+def percentiles(values, points=(50, 90, 99)):
+    if not values:
+        return {}
+    values = sorted(values)
+    result = {}
+    for p in points:
+        result[f"p{p}"] = values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+    result["max"] = values[-1]
+    return result
+
+def mean(values):
+    return sum(values) / len(values) if values else None
+
+# options go to the planner's constructor, replan_rate overrides Enemy.REPLAN_RATE (only used by the
+# "cooldown" trigger) and refine_iterations is how long each plan keeps looking for a shorter path
+# after the first one
+def run(seed, trajectory, frames, planner=main.PLANNER, options=None, replan_rate=None, refine_iterations=0,
+        replan_trigger=main.REPLAN_TRIGGER, replan_distance=main.REPLAN_DISTANCE):
+    # Same order of random calls as Simulation so a seed gives the same map as in the game
+    random.seed(seed)
+    collision_map = CountingCollisionMap(main.generate_obstacle_rects(), main.WORLD_WIDTH, main.WORLD_HEIGHT)
+    player = main.Player(main.WORLD_WIDTH // 2, main.WORLD_HEIGHT // 2, collision_map)
+
+    enemy = BenchmarkEnemy(50, 50, collision_map)
+    enemy.planner = main.make_planner(planner, collision_map, **(options or {}))
+    enemy.async_planning = False
+    if replan_rate is not None:
+        enemy.REPLAN_RATE = replan_rate
+    enemy.refine_iterations = refine_iterations
+    enemy.replan_trigger = replan_trigger
+    enemy.replan_distance = replan_distance
+
+    script = TRAJECTORIES[trajectory]
+    frame_times = []
+    catch_intervals = []
+    last_catch = 0
+    recoveries = 0
+    for frame in range(frames):
+        was_recovering = enemy.is_recovering
+        start = time.perf_counter()
+        player.update(main.PLAYER_SPEED, script(frame, player.pos, seed))
+        enemy.update(player.pos, main.ENEMY_SPEED)
+        frame_times.append((time.perf_counter() - start) * 1000)
+        if enemy.is_recovering and not was_recovering:
+            recoveries += 1
+
+        # Keep the run going after a catch so every run covers the same number of frames
+        if player.rect.colliderect(enemy.rect):
+            catch_intervals.append(frame + 1 - last_catch)
+            last_catch = frame + 1
+            enemy.pos.update(50, 50)
+            enemy.rect.center = (50, 50)
+            enemy.path = []
+
+    plans = enemy.plans
+    found = [p for p in plans if p["found"]]
+    return {
+        "seed": seed,
+        "trajectory": trajectory,
+        "frames": frames,
+        "replans": len(plans),
+        "failed_replans": len(plans) - len(found),
+        "replan_latency_ms": percentiles([p["latency_ms"] for p in plans]),
+        "first_path_ms": percentiles([p["first_path_ms"] for p in found]),
+        "iterations_per_plan": mean([p["iterations"] for p in plans]),
+        "iterations_to_first_path": percentiles([p["iterations_to_first_path"] for p in found]),
+        "nodes_to_first_path": mean([p["nodes_to_first_path"] for p in found]),
+        "collision_checks_per_plan": mean([p["collision_checks"] for p in plans]),
+        "path_cost": mean([p["path_cost"] for p in found]),
+        "frame_time_ms": percentiles(frame_times),
+        "frames_over_budget": sum(1 for t in frame_times if t > FRAME_BUDGET_MS),
+        "catches": len(catch_intervals),
+        "frames_to_catch": mean(catch_intervals),
+        "recoveries": recoveries,
+        "_latencies": [p["latency_ms"] for p in plans],
+        "_first_path_times": [p["first_path_ms"] for p in found],
+        "_frame_times": frame_times,
+        "_catch_intervals": catch_intervals,
+    }
+
+def summarize(runs):
+    latencies = [t for r in runs for t in r.pop("_latencies")]
+    first_path_times = [t for r in runs for t in r.pop("_first_path_times")]
+    frame_times = [t for r in runs for t in r.pop("_frame_times")]
+    catch_intervals = [t for r in runs for t in r.pop("_catch_intervals")]
+    return {
+        "replans": sum(r["replans"] for r in runs),
+        "failed_replans": sum(r["failed_replans"] for r in runs),
+        "replan_latency_ms": percentiles(latencies),
+        "first_path_ms": percentiles(first_path_times),
+        "iterations_per_plan": mean([r["iterations_per_plan"] for r in runs if r["replans"]]),
+        "nodes_to_first_path": mean([r["nodes_to_first_path"] for r in runs if r["nodes_to_first_path"] is not None]),
+        "collision_checks_per_plan": mean([r["collision_checks_per_plan"] for r in runs if r["replans"]]),
+        "path_cost": mean([r["path_cost"] for r in runs if r["path_cost"] is not None]),
+        "frame_time_ms": percentiles(frame_times),
+        "frames_over_budget": sum(r["frames_over_budget"] for r in runs),
+        "catches": sum(r["catches"] for r in runs),
+        "frames_to_catch": mean(catch_intervals),
+        "recoveries": sum(r["recoveries"] for r in runs),
+    }
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Headless benchmark for the chaser's planner")
+    parser.add_argument("--seeds", type=int, default=5, help="number of maps, seeded 0..N-1")
+    parser.add_argument("--frames", type=int, default=1200, help="frames simulated per run")
+    parser.add_argument("--trajectories", default=",".join(TRAJECTORIES),
+                        help="comma separated subset of: " + ", ".join(TRAJECTORIES))
+    parser.add_argument("--planner", choices=tuple(main.PLANNERS), default=main.PLANNER)
+    parser.add_argument("--backend", choices=("object", "array"), default=main.TREE_BACKEND)
+    parser.add_argument("--cold-start", action="store_true", help="rebuild the tree on every replan")
+    parser.add_argument("--informed", action=argparse.BooleanOptionalAction, default=main.INFORMED_SAMPLING,
+                        help="sample the informed ellipse once a path exists")
+    parser.add_argument("--adaptive-bias", action=argparse.BooleanOptionalAction, default=main.ADAPTIVE_GOAL_BIAS,
+                        help="adapt the goal bias to recent goal-directed successes")
+    parser.add_argument("--rewire", action=argparse.BooleanOptionalAction, default=main.CONNECT_REWIRE,
+                        help="RRT* rewiring on both RRT-Connect trees")
+    parser.add_argument("--lazy", action=argparse.BooleanOptionalAction, default=main.LAZY_EDGES,
+                        help="Lazy RRT*, check edges only once they're on a returned path")
+    parser.add_argument("--replan-trigger", choices=("events", "cooldown"), default=main.REPLAN_TRIGGER,
+                        help="replan when the path stops fitting, or every REPLAN_RATE frames")
+    parser.add_argument("--replan-distance", type=float, default=main.REPLAN_DISTANCE,
+                        help="how far the player may get from the planned goal before an event replan")
+    parser.add_argument("--refine", type=int, default=0, help="iterations spent shortening each path after the first")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    trajectories = [t for t in args.trajectories.split(",") if t]
+    for name in trajectories:
+        if name not in TRAJECTORIES:
+            sys.exit(f"unknown trajectory {name!r}")
+
+    if args.planner == "rrtstar":
+        options = {"tree_backend": args.backend, "warm_start": not args.cold_start, "informed": args.informed,
+                   "adaptive_bias": args.adaptive_bias, "lazy": args.lazy}
+    elif args.planner == "rrtconnect":
+        options = {"warm_start": not args.cold_start, "rewire": args.rewire}
+    else:
+        options = {}
+    runs = []
+    for seed in range(args.seeds):
+        for trajectory in trajectories:
+            runs.append(run(seed, trajectory, args.frames, args.planner, options, refine_iterations=args.refine,
+                            replan_trigger=args.replan_trigger, replan_distance=args.replan_distance))
+
+    report = {
+        "config": {
+            "seeds": args.seeds,
+            "frames": args.frames,
+            "trajectories": trajectories,
+            "planner": args.planner,
+            "tree_backend": args.backend,
+            "warm_start": not args.cold_start,
+            "informed": args.informed,
+            "adaptive_bias": args.adaptive_bias,
+            "lazy": args.lazy,
+            "rewire": args.rewire,
+            "refine_iterations": args.refine,
+            "replan_trigger": args.replan_trigger,
+            "replan_distance": args.replan_distance,
+            "frame_budget_ms": FRAME_BUDGET_MS,
+        },
+        "summary": summarize(runs),
+        "runs": runs,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,225 @@
+import numpy as np
+
+from spatial import BoxGrid
+
+# Boxes are closed on the low side and open on the high side, matching is_point_free
+EDGE_EPSILON = 1e-9
+
+# Below this many segments a NumPy call costs more in overhead than the plain loop it replaces
+BATCH_MIN_SEGMENTS = 24
+
+# Maps with at least this many obstacles bucket them in a BoxGrid so a check only looks at the nearby ones
+BUCKET_MIN_BOXES = 64
+BUCKET_SIZE = 128
+# An occupancy bitmap bigger than this isn't built, points are checked against the boxes instead
+MAX_GRID_BYTES = 1 << 23
+
+# Configuration-space collision checks. The obstacles never move during a game so everything is
+# built once per map: obstacles are inflated by the agent's half-size, which turns "does a 30x30
+# square at pos hit anything" into "is pos inside an inflated rect".
+
+class CollisionMap:
+    # occupancy is an (x0, y0, grid) triple from a baked level (see levels.py), which skips
+    # rasterising the obstacles. grid is the (rows, stride) uint8 array, usually memory-mapped.
+    def __init__(self, rects, width, height, half_size=15, occupancy=None):
+        self.width = width
+        self.height = height
+        self.half_size = half_size
+        self.rects = [tuple(r) for r in rects]
+
+        # The old checks built pygame.Rect(pos.x - 15, pos.y - 15, 30, 30), which truncates the
+        # corner to an int, and used colliderect. So for an obstacle (ox, oy, ow, oh) a position is
+        # blocked when ox - 30 < int(pos.x - 15) < ox + ow, same for y. Converted to the
+        # centre position that's the half-open interval [ox - 14, ox + ow + 15).
+        self.boxes = []
+        for ox, oy, ow, oh in self.rects:
+            self.boxes.append((ox - half_size + 1, oy - half_size + 1,
+                               ox + ow + half_size, oy + oh + half_size))
+        # The same boxes for the truncated top-left corner, what the bitmap is indexed by
+        self.corner_boxes = [(left - half_size, top - half_size, right - half_size, bottom - half_size)
+                             for left, top, right, bottom in self.boxes]
+        self.buckets = None
+        if len(self.boxes) >= BUCKET_MIN_BOXES:
+            # Widened by one on the low side, truncation can block a centre just below the box
+            self.buckets = BoxGrid([(left - 1, top - 1, right, bottom) for left, top, right, bottom in self.boxes],
+                                   width, height, BUCKET_SIZE)
+
+        # Occupancy bitmap indexed by the truncated top-left corner of the agent rect,
+        # only covering the area around the obstacles. Outside of it everything is free.
+        # grid is None on maps where it would be too big.
+        if occupancy is not None:
+            self.x0, self.y0, grid = occupancy
+            self.rows, self.stride = grid.shape
+            self.grid = memoryview(np.ascontiguousarray(grid, dtype=np.uint8)).cast("B")
+        else:
+            self.build_grid()
+
+        # Array views of the same data for the batched queries
+        self.grid_array = None
+        if self.grid is not None:
+            self.grid_array = np.frombuffer(self.grid, dtype=np.uint8).reshape(self.rows, self.stride)
+        self.box_array = np.array(self.boxes, dtype=float).reshape(-1, 4)
+        self.box_array[:, 2:] -= EDGE_EPSILON
+        self.corner_box_array = np.array(self.corner_boxes, dtype=np.int64).reshape(-1, 4)
+
+    def build_grid(self):
+        size = self.half_size * 2
+        if self.rects:
+            self.x0 = min(ox - size + 1 for ox, _, _, _ in self.rects)
+            self.y0 = min(oy - size + 1 for _, oy, _, _ in self.rects)
+            x1 = max(ox + ow for ox, _, ow, _ in self.rects)
+            y1 = max(oy + oh for _, oy, _, oh in self.rects)
+        else:
+            self.x0 = self.y0 = x1 = y1 = 0
+        self.stride = x1 - self.x0
+        self.rows = y1 - self.y0
+        if self.stride * self.rows > MAX_GRID_BYTES:
+            self.grid = None
+            return
+        self.grid = bytearray(self.stride * self.rows)
+        for ox, oy, ow, oh in self.rects:
+            left = ox - size + 1 - self.x0
+            right = ox + ow - self.x0
+            row = b"\x01" * (right - left)
+            for ty in range(oy - size + 1 - self.y0, oy + oh - self.y0):
+                start = ty * self.stride
+                self.grid[start + left:start + right] = row
+
+    def in_bounds(self, pos):
+        hs = self.half_size
+        return hs <= pos[0] <= self.width - hs and hs <= pos[1] <= self.height - hs
+
+    def is_point_free(self, pos):
+        if self.grid is None:
+            return self.point_free_in_boxes(pos)
+        tx = int(pos[0] - self.half_size) - self.x0
+        ty = int(pos[1] - self.half_size) - self.y0
+        if 0 <= tx < self.stride and 0 <= ty < self.rows:
+            return not self.grid[ty * self.stride + tx]
+        return True
+
+    def point_free_in_boxes(self, pos):
+        # The bitmap's test done box by box, for maps without one
+        tx = int(pos[0] - self.half_size)
+        ty = int(pos[1] - self.half_size)
+        boxes = self.corner_boxes
+        for i in self.buckets.at(pos[0], pos[1]) if self.buckets is not None else range(len(boxes)):
+            left, top, right, bottom = boxes[i]
+            if left <= tx < right and top <= ty < bottom:
+                return False
+        return True
+
+    def is_segment_free(self, start, end):
+        # Exact swept test of the agent centre against every inflated box (Liang-Barsky clipping),
+        # so unlike fixed-step sampling it can't jump over a corner.
+        sx, sy = start[0], start[1]
+        dx, dy = end[0] - sx, end[1] - sy
+        min_x, max_x = min(sx, sx + dx), max(sx, sx + dx)
+        min_y, max_y = min(sy, sy + dy), max(sy, sy + dy)
+
+        boxes = self.boxes
+        if self.buckets is not None:
+            boxes = [boxes[i] for i in self.buckets.near(min_x, min_y, max_x, max_y)]
+        for left, top, right, bottom in boxes:
+            if max_x < left or min_x >= right or max_y < top or min_y >= bottom:
+                continue
+            if segment_hits_box(sx, sy, dx, dy, left, top, right, bottom):
+                return False
+        return True
+
+    def is_path_clear(self, start, end):
+        return self.is_point_free(start) and self.is_segment_free(start, end)
+
+    # Batched versions. Positions come in as (n, 2) arrays (or anything np.asarray turns into one)
+    # and the answer is a boolean mask, all segments against all boxes in one go, or with buckets
+    # every segment against the boxes near it.
+
+    def points_free(self, points):
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if self.grid is None:
+            return self.points_free_in_boxes(points)
+        tx = np.trunc(points[:, 0] - self.half_size).astype(np.int64) - self.x0
+        ty = np.trunc(points[:, 1] - self.half_size).astype(np.int64) - self.y0
+        inside = (tx >= 0) & (tx < self.stride) & (ty >= 0) & (ty < self.rows)
+        free = np.ones(len(points), dtype=bool)
+        free[inside] = self.grid_array[ty[inside], tx[inside]] == 0
+        return free
+
+    def points_free_in_boxes(self, points):
+        corners = np.trunc(points - self.half_size).astype(np.int64)
+        if self.buckets is not None:
+            query, box = self.buckets.pairs(points[:, 0], points[:, 1], points[:, 0], points[:, 1])
+        else:
+            query = np.repeat(np.arange(len(points)), len(self.corner_boxes))
+            box = np.tile(np.arange(len(self.corner_boxes)), len(points))
+        boxes = self.corner_box_array[box]
+        corners = corners[query]
+        inside = ((boxes[:, 0] <= corners[:, 0]) & (corners[:, 0] < boxes[:, 2]) &
+                  (boxes[:, 1] <= corners[:, 1]) & (corners[:, 1] < boxes[:, 3]))
+        free = np.ones(len(points), dtype=bool)
+        free[query[inside]] = False
+        return free
+
+    def segments_free(self, starts, ends):
+        starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+        ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+        if len(self.box_array) == 0:
+            return np.ones(len(starts), dtype=bool)
+
+        if self.buckets is None:
+            # Rows are segments and columns are boxes
+            return ~segments_hit_boxes(starts[:, None, :], ends[:, None, :], self.box_array).any(axis=1)
+
+        low = np.minimum(starts, ends)
+        high = np.maximum(starts, ends)
+        query, box = self.buckets.pairs(low[:, 0], low[:, 1], high[:, 0], high[:, 1])
+        hits = segments_hit_boxes(starts[query], ends[query], self.box_array[box])
+        free = np.ones(len(starts), dtype=bool)
+        free[query[hits]] = False
+        return free
+
+    def paths_clear(self, starts, ends):
+        """Batched is_path_clear, returns a boolean mask over the segments"""
+        if len(starts) < BATCH_MIN_SEGMENTS:
+            return np.array([self.is_path_clear(s, e) for s, e in zip(starts, ends)], dtype=bool)
+        return self.points_free(starts) & self.segments_free(starts, ends)
+
+def segments_hit_boxes(starts, ends, boxes):
+    """Same slab clipping as segment_hits_box, for (..., 2) segment ends and (..., 4) boxes that broadcast"""
+    shape = np.broadcast_shapes(starts.shape[:-1], boxes.shape[:-1])
+    t0 = np.zeros(shape)
+    t1 = np.ones(shape)
+    for axis in (0, 1):
+        p = starts[..., axis]
+        d = ends[..., axis] - p
+        lo = boxes[..., axis]
+        hi = boxes[..., axis + 2]
+        moving = d != 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ta = (lo - p) / d
+            tb = (hi - p) / d
+        enter = np.where(moving, np.minimum(ta, tb), -np.inf)
+        leave = np.where(moving, np.maximum(ta, tb), np.inf)
+        # A segment that doesn't move along this axis is either always inside the slab or never
+        outside = ~moving & ((p < lo) | (p > hi))
+        enter = np.where(outside, np.inf, enter)
+        np.maximum(t0, enter, out=t0)
+        np.minimum(t1, leave, out=t1)
+    return t0 <= t1
+
+def segment_hits_box(sx, sy, dx, dy, left, top, right, bottom):
+    t0, t1 = 0.0, 1.0
+    for p, d, lo, hi in ((sx, dx, left, right - EDGE_EPSILON), (sy, dy, top, bottom - EDGE_EPSILON)):
+        if d == 0:
+            if p < lo or p > hi:
+                return False
+            continue
+        ta = (lo - p) / d
+        tb = (hi - p) / d
+        if ta > tb:
+            ta, tb = tb, ta
+        t0 = max(t0, ta)
+        t1 = min(t1, tb)
+        if t0 > t1:
+            return False
+    return True
@@ -0,0 +1,130 @@
+import heapq
+import itertools
+import math
+
+import numpy as np
+
+# Shared pursuit field. The map is cut into a grid, and a Dijkstra run from the player's cell gives
+# every cell its distance to the player and the neighbouring cell that leads there. Any number of
+# enemies can then follow it with one lookup each per tick, and the search only reruns when the
+# player moves into another cell, so the cost doesn't grow with the number of chasers.
+
+FLOW_CELL_SIZE = 20
+
+# Neighbour offsets (dx, dy), diagonals included. FORWARD is half of them, one per opposite pair.
+DIRECTIONS = [(dx, dy) for dx, dy in itertools.product((-1, 0, 1), repeat=2) if dx or dy]
+FORWARD = [(1, 0), (0, 1), (1, 1), (1, -1)]
+
+class FlowField:
+    def __init__(self, collision_map, cell_size=FLOW_CELL_SIZE):
+        self.collision_map = collision_map
+        self.cell_size = cell_size
+        self.cols = collision_map.width // cell_size
+        self.rows = collision_map.height // cell_size
+        n = self.cols * self.rows
+
+        # A cell is usable if the agent fits at its centre. Cells are numbered row by row.
+        xs = (np.arange(self.cols) + 0.5) * cell_size
+        ys = (np.arange(self.rows) + 0.5) * cell_size
+        centers = np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2)
+        hs = collision_map.half_size
+        inside = ((centers[:, 0] >= hs) & (centers[:, 0] <= collision_map.width - hs) &
+                  (centers[:, 1] >= hs) & (centers[:, 1] <= collision_map.height - hs))
+        self.free = (inside & collision_map.points_free(centers)).tolist()
+        self.centers = [tuple(c) for c in centers.tolist()]
+
+        # Links between neighbouring free cells, kept only if the straight move between them is clear.
+        # Checked once per map, in one batch.
+        pairs = []
+        for index in range(n):
+            if not self.free[index]:
+                continue
+            col, row = index % self.cols, index // self.cols
+            for dx, dy in FORWARD:
+                c, r = col + dx, row + dy
+                if 0 <= c < self.cols and 0 <= r < self.rows and self.free[r * self.cols + c]:
+                    pairs.append((index, r * self.cols + c, cell_size * math.hypot(dx, dy)))
+        self.neighbours = [[] for _ in range(n)]
+        if pairs:
+            first = np.array([p[0] for p in pairs])
+            second = np.array([p[1] for p in pairs])
+            clear = collision_map.segments_free(centers[first], centers[second])
+            for (a, b, cost), is_clear in zip(pairs, clear.tolist()):
+                if is_clear:
+                    self.neighbours[a].append((b, cost))
+                    self.neighbours[b].append((a, cost))
+
+        self.distance = [math.inf] * n
+        # Cell to head for next from each cell, -1 means go straight for the target
+        self.next = [-1] * n
+        self.target = None
+        self.target_cell = None
+        self.recomputes = 0
+
+    def cell_of(self, pos):
+        col, row = int(pos[0] // self.cell_size), int(pos[1] // self.cell_size)
+        if 0 <= col < self.cols and 0 <= row < self.rows:
+            return row * self.cols + col
+        return None
+
+    def nearby_cells(self, pos):
+        col, row = int(pos[0] // self.cell_size), int(pos[1] // self.cell_size)
+        for dx, dy in [(0, 0)] + DIRECTIONS:
+            c, r = col + dx, row + dy
+            if 0 <= c < self.cols and 0 <= r < self.rows:
+                yield r * self.cols + c
+
+    def update(self, target):
+        """Call every tick with the player's position, returns True if the field was rebuilt"""
+        self.target = (target[0], target[1])
+        cell = self.cell_of(self.target)
+        if cell == self.target_cell:
+            return False
+        self.target_cell = cell
+        self.recompute()
+        return True
+
+    def recompute(self):
+        n = len(self.centers)
+        distance = [math.inf] * n
+        following = [-1] * n
+        frontier = []
+        # The player's own cell centre can be blocked while the player isn't, so every free cell
+        # around it with a clear line to the player is a source
+        for cell in self.nearby_cells(self.target):
+            if self.free[cell] and self.collision_map.is_segment_free(self.centers[cell], self.target):
+                distance[cell] = math.dist(self.centers[cell], self.target)
+                frontier.append((distance[cell], cell))
+        heapq.heapify(frontier)
+
+        neighbours = self.neighbours
+        while frontier:
+            dist, cell = heapq.heappop(frontier)
+            if dist > distance[cell]:
+                continue
+            for other, cost in neighbours[cell]:
+                new_dist = dist + cost
+                if new_dist < distance[other]:
+                    distance[other] = new_dist
+                    following[other] = cell
+                    heapq.heappush(frontier, (new_dist, other))
+
+        self.distance = distance
+        self.next = following
+        self.recomputes += 1
+
+    def waypoint(self, pos):
+        """Where an agent at pos should head next, or None if the player can't be reached from here"""
+        cell = self.cell_of(pos)
+        if cell is not None and self.free[cell] and self.distance[cell] < math.inf:
+            following = self.next[cell]
+            return self.target if following < 0 else self.centers[following]
+
+        # Off the grid or in a cell whose centre is blocked, step to the best cell in reach instead
+        best, best_dist = None, math.inf
+        for other in self.nearby_cells(pos):
+            if self.free[other] and self.distance[other] < math.inf:
+                dist = self.distance[other] + math.dist(pos, self.centers[other])
+                if dist < best_dist and self.collision_map.is_segment_free(pos, self.centers[other]):
+                    best, best_dist = self.centers[other], dist
+        return best
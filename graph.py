@@ -0,0 +1,173 @@
+import heapq
+import math
+import weakref
+
+import numpy as np
+import pygame
+
+# Static graphs over the free space, searched with A* by the visibility and PRM planners. A graph is
+# a list of node positions plus each node's (neighbour, length) links, built once per map and shared
+# by every enemy on it. Subclasses decide where the nodes go and which pairs get linked; storage,
+# baking for levels.py, linking a query into the graph, the search and the drawing interface live here.
+
+START = -1
+GOAL = -2
+
+class StaticGraph:
+    # One graph per CollisionMap and subclass, shared by every enemy on that map
+    graphs = weakref.WeakKeyDictionary()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.graphs = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def for_map(cls, collision_map):
+        graph = cls.graphs.get(collision_map)
+        if graph is None:
+            graph = cls.graphs[collision_map] = cls(collision_map)
+        return graph
+
+    def __init__(self, collision_map):
+        self.collision_map = collision_map
+        # Nodes are only ever appended, see RRTStar.revision
+        self.revision = 0
+        self.expanded = 0
+        self.nodes = []
+        self.node_array = np.empty((0, 2))
+        self.links = []
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def add_nodes(self, positions):
+        self.nodes.extend(positions)
+        self.node_array = np.array(self.nodes, dtype=float).reshape(-1, 2)
+        self.links.extend([] for _ in positions)
+
+    def link(self, pairs):
+        """Links every (i, j) node pair whose straight line is clear, checked in one batch"""
+        if not pairs:
+            return
+        first = [i for i, _ in pairs]
+        second = [j for _, j in pairs]
+        clear = self.collision_map.paths_clear(self.node_array[first], self.node_array[second])
+        for (i, j), is_clear in zip(pairs, clear.tolist()):
+            if is_clear:
+                length = math.dist(self.nodes[i], self.nodes[j])
+                self.links[i].append((j, length))
+                self.links[j].append((i, length))
+
+    def candidates(self, pos):
+        """Nodes worth checking for a clear line to pos, all of them unless a subclass narrows it down"""
+        return np.arange(len(self.nodes))
+
+    def visible_nodes(self, pos, outgoing=True):
+        """(node index, distance) for the candidate nodes with a clear line to or from pos"""
+        if not self.nodes:
+            return []
+        nodes = self.candidates(pos)
+        point = np.broadcast_to((pos[0], pos[1]), (len(nodes), 2))
+        if outgoing:
+            clear = self.collision_map.paths_clear(point, self.node_array[nodes])
+        else:
+            clear = self.collision_map.paths_clear(self.node_array[nodes], point)
+        return [(i, math.dist(pos, self.nodes[i])) for i in nodes[clear].tolist()]
+
+    def shortest_path(self, start, goal):
+        start = (float(start[0]), float(start[1]))
+        goal = (float(goal[0]), float(goal[1]))
+        self.expanded = 0
+        if not self.collision_map.is_point_free(goal):
+            return None
+        if self.collision_map.is_path_clear(start, goal):
+            return [pygame.math.Vector2(start), pygame.math.Vector2(goal)]
+
+        from_start = self.visible_nodes(start)
+        to_goal = dict(self.visible_nodes(goal, outgoing=False))
+        if not from_start or not to_goal:
+            return None
+
+        def position(node):
+            return start if node == START else goal if node == GOAL else self.nodes[node]
+
+        best = {START: 0.0}
+        parent = {START: None}
+        frontier = [(math.dist(start, goal), 0.0, START)]
+        while frontier:
+            _, cost, node = heapq.heappop(frontier)
+            if node == GOAL:
+                points = []
+                while node is not None:
+                    points.append(position(node))
+                    node = parent[node]
+                points.reverse()
+                return [pygame.math.Vector2(p) for p in self.smooth(points)]
+            if cost > best[node]:
+                continue
+            self.expanded += 1
+
+            if node == START:
+                links = from_start
+            elif node in to_goal:
+                links = self.links[node] + [(GOAL, to_goal[node])]
+            else:
+                links = self.links[node]
+            for neighbour, length in links:
+                new_cost = cost + length
+                if new_cost < best.get(neighbour, math.inf):
+                    best[neighbour] = new_cost
+                    parent[neighbour] = node
+                    heapq.heappush(frontier, (new_cost + math.dist(position(neighbour), goal), new_cost, neighbour))
+        return None
+
+    def smooth(self, points):
+        """Hook for cleaning up the waypoints A* found, as plain (x, y) tuples"""
+        return points
+
+    # Baked form for levels.py, the links flattened into one list per field plus where each node's start
+
+    def to_arrays(self):
+        return {
+            "nodes": self.node_array,
+            "offsets": np.cumsum([0] + [len(links) for links in self.links], dtype=np.int32),
+            "targets": np.array([j for links in self.links for j, _ in links], dtype=np.int32),
+            "lengths": np.array([length for links in self.links for _, length in links], dtype=float),
+        }
+
+    @classmethod
+    def from_arrays(cls, collision_map, arrays):
+        graph = cls.__new__(cls)
+        StaticGraph.__init__(graph, collision_map)
+        graph.node_array = np.array(arrays["nodes"], dtype=float).reshape(-1, 2)
+        graph.nodes = [tuple(p) for p in graph.node_array.tolist()]
+        offsets = arrays["offsets"].tolist()
+        targets = arrays["targets"].tolist()
+        lengths = arrays["lengths"].tolist()
+        graph.links = [list(zip(targets[a:b], lengths[a:b])) for a, b in zip(offsets, offsets[1:])]
+        return graph
+
+    # Same drawing interface as the RRT* trees so the debug view can show the graph
+
+    def get_tree_edges(self, start=0):
+        return [(self.nodes[i], self.nodes[j])
+                for j in range(start, len(self.nodes)) for i, _ in self.links[j] if i < j]
+
+    def get_node_positions(self, start=0):
+        return self.nodes[start:]
+
+class GraphPlanner:
+    """Planner backend that answers every replan with an A* query on the map's shared graph_class"""
+    graph_class = None
+
+    def __init__(self, collision_map):
+        self.tree = self.graph_class.for_map(collision_map)
+        self.iterations = 0
+
+    def plan_steps(self, start, goal, refine_iterations=0):
+        path = self.tree.shortest_path(start, goal)
+        self.iterations = self.tree.expanded
+        yield path
+
+def path_length(path):
+    return sum(path[i].distance_to(path[i + 1]) for i in range(len(path) - 1))
@@ -0,0 +1,198 @@
+# Level files and the planning data baked from them.
+#
+# A level is a small JSON file with the map size, the obstacle rects and where the player and enemies
+# start, so curated maps can be shipped instead of rolled from the seed. Everything derived from
+# the obstacles (the inflated occupancy grid, the visibility graph, the PRM roadmap) only depends on
+# the layout, so it is baked once into .npy files under <cache>/<map hash>/ and memory-mapped on the
+# next start.
+#
+#   python levels.py export --seed 7 --enemies 4 levels/arena.json
+#   python levels.py bake levels/arena.json
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from collision import CollisionMap
+from prm import Roadmap
+from visibility import VisibilityGraph
+
+LEVEL_VERSION = 1
+# Bump when an artifact's layout or the settings it's built with change, older ones are rebuilt
+ARTIFACT_VERSION = 2
+DEFAULT_CACHE = os.path.join("levels", "cache")
+
+# Planner kind -> roadmap class with for_map/graphs, to_arrays and from_arrays
+ROADMAPS = {
+    "visibility": VisibilityGraph,
+    "prm": Roadmap,
+}
+
+class Level:
+    def __init__(self, width, height, obstacles, player_spawn, enemy_spawns=()):
+        self.width = width
+        self.height = height
+        self.obstacles = [tuple(int(v) for v in rect) for rect in obstacles]
+        self.player_spawn = tuple(player_spawn)
+        self.enemy_spawns = [tuple(p) for p in enemy_spawns]
+
+    @property
+    def map_hash(self):
+        return map_hash(self.obstacles, self.width, self.height)
+
+    def to_dict(self):
+        return {
+            "version": LEVEL_VERSION,
+            "width": self.width,
+            "height": self.height,
+            "obstacles": [list(r) for r in self.obstacles],
+            "player": list(self.player_spawn),
+            "enemies": [list(p) for p in self.enemy_spawns],
+        }
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, separators=(",", ":"))
+            f.write("\n")
+
+def load(path):
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("version") != LEVEL_VERSION:
+        raise ValueError(f"{path}: unsupported level version {data.get('version')!r}")
+    return Level(data["width"], data["height"], data["obstacles"], data["player"], data.get("enemies", ()))
+
+def map_hash(rects, width, height, half_size=15):
+    """Names the baked data for a layout, anything that changes the inflated map changes the hash"""
+    key = json.dumps([width, height, half_size, [list(r) for r in rects]])
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+class ArtifactCache:
+    """Named sets of arrays per map hash, one .npy file per array plus a small JSON manifest"""
+    def __init__(self, directory=DEFAULT_CACHE, mmap=True):
+        self.directory = directory
+        self.mmap = mmap
+
+    def folder(self, key):
+        return os.path.join(self.directory, key)
+
+    def load(self, key, name):
+        """The arrays saved under name, or None if there's nothing usable"""
+        try:
+            with open(os.path.join(self.folder(key), name + ".json")) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("version") != ARTIFACT_VERSION:
+            return None
+        arrays = {}
+        for array in manifest["arrays"]:
+            path = os.path.join(self.folder(key), f"{name}-{array}.npy")
+            try:
+                arrays[array] = np.load(path, mmap_mode="r" if self.mmap else None)
+            except ValueError:
+                # Zero-length arrays can't be mapped, and some file systems (the browser's) can't map at all
+                arrays[array] = np.load(path)
+            except OSError:
+                return None
+        return arrays
+
+    def save(self, key, name, arrays):
+        folder = self.folder(key)
+        os.makedirs(folder, exist_ok=True)
+        for array, values in arrays.items():
+            np.save(os.path.join(folder, f"{name}-{array}.npy"), np.ascontiguousarray(values))
+        # Written last, a bake that was cut short has no manifest and is redone
+        with open(os.path.join(folder, name + ".json"), "w") as f:
+            json.dump({"version": ARTIFACT_VERSION, "arrays": list(arrays)}, f)
+
+def load_collision_map(rects, width, height, cache=None):
+    if cache is None:
+        return CollisionMap(rects, width, height)
+    key = map_hash(rects, width, height)
+    baked = cache.load(key, "occupancy")
+    if baked is not None:
+        x0, y0 = baked["origin"].tolist()
+        return CollisionMap(rects, width, height, occupancy=(x0, y0, baked["grid"]))
+    collision_map = CollisionMap(rects, width, height)
+    # Maps too big for a bitmap check against the obstacles directly, nothing to bake
+    if collision_map.grid is not None:
+        cache.save(key, "occupancy", {"origin": np.array([collision_map.x0, collision_map.y0], dtype=np.int64),
+                                      "grid": collision_map.grid_array})
+    return collision_map
+
+def load_roadmap(kind, collision_map, cache):
+    """Baked roadmap for planners that use one, registered as the map's shared instance"""
+    roadmap_class = ROADMAPS.get(kind)
+    if roadmap_class is None:
+        return None
+    key = map_hash(collision_map.rects, collision_map.width, collision_map.height, collision_map.half_size)
+    baked = cache.load(key, kind)
+    if baked is not None:
+        roadmap = roadmap_class.from_arrays(collision_map, baked)
+        roadmap_class.graphs[collision_map] = roadmap
+    else:
+        roadmap = roadmap_class.for_map(collision_map)
+        cache.save(key, kind, roadmap.to_arrays())
+    return roadmap
+
+def export_level(seed, enemies):
+    """The map the game would generate for seed, as a Level"""
+    import random
+    import main
+    random.seed(seed)
+    rects = [tuple(r) for r in main.generate_obstacle_rects()]
+    collision_map = CollisionMap(rects, main.WORLD_WIDTH, main.WORLD_HEIGHT)
+    spawns = [(round(x), round(y)) for x, y in main.enemy_spawn_points(enemies, collision_map)]
+    width, height = main.WORLD_WIDTH, main.WORLD_HEIGHT
+    return Level(width, height, rects, (width // 2, height // 2), spawns)
+
+def bake(level, cache):
+    """Builds every artifact for level that isn't in cache yet, returns {name: seconds}"""
+    times = {}
+    start = time.perf_counter()
+    collision_map = load_collision_map(level.obstacles, level.width, level.height, cache)
+    times["occupancy"] = time.perf_counter() - start
+    for kind in ROADMAPS:
+        start = time.perf_counter()
+        load_roadmap(kind, collision_map, cache)
+        times[kind] = time.perf_counter() - start
+    return times
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Export and bake level files")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write the map generated for a seed as a level file")
+    export.add_argument("level", help="level file to write")
+    export.add_argument("--seed", type=int, required=True)
+    export.add_argument("--enemies", type=int, default=1, help="enemy spawn points to store")
+    baker = commands.add_parser("bake", help="precompute the planning data for level files")
+    baker.add_argument("levels", nargs="+")
+    baker.add_argument("--cache", default=DEFAULT_CACHE, help="where baked data goes")
+    return parser.parse_args(argv)
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    if args.command == "export":
+        level = export_level(args.seed, args.enemies)
+        level.save(args.level)
+        print(f"{args.level}: {len(level.obstacles)} obstacles, map hash {level.map_hash}")
+        return
+
+    cache = ArtifactCache(args.cache)
+    for path in args.levels:
+        try:
+            level = load(path)
+        except (OSError, ValueError) as e:
+            sys.exit(str(e))
+        times = bake(level, cache)
+        summary = ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in times.items())
+        print(f"{path}: {cache.folder(level.map_hash)} ({summary})")
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,7 +1,22 @@
 import pygame
 import asyncio
+import heapq
 import math
 import random
+import sys
+import time
+
+from collision import CollisionMap
+from flowfield import FlowField
+from graph import GraphPlanner, path_length
+import levels
+from prm import PRMPlanner
+from profiler import Profiler
+from recording import Recorder
+from sampling import AdaptiveGoalBias, informed_sample
+from rrt_array import ArrayRRTStar
+from spatial import BoxGrid, SpatialGrid
+from visibility import VisibilityGraphPlanner
 
 # You can load this onto localhost using pygbag (pip install pygbag) and then run the following line:
 # pygbag --template main.tmpl main.py
@@ -11,11 +26,94 @@ import random
 # It's implementation can be found here (I did not make it): https://github.com/timetrapped-creations/pygbag 
 
 WIDTH, HEIGHT = 1000, 600
+# Size of the world, which can be much bigger than the window: the view then scrolls with the player
+# and only what's on screen gets drawn. Thousands of obstacles are fine, collision checks bucket
+# them (see collision.py), though the visibility graph and flow field are meant for window-sized maps.
+WORLD_WIDTH, WORLD_HEIGHT = WIDTH, HEIGHT
 PLAYER_SPEED = 5 
 ENEMY_SPEED = 3
 OBSTACLE_COUNT = 8
 COLLECTIBLE_COUNT = 5
 
+# The game moves in fixed steps of 1 / TICK_RATE seconds however fast frames are drawn. A frame
+# that took too long catches up with at most MAX_TICKS_PER_FRAME steps and drops the rest.
+TICK_RATE = 60
+MAX_TICKS_PER_FRAME = 5
+
+# Set to a path like "session-{seed}.json" to save every game's seed, settings and input for
+# replay.py. Only games with ASYNC_PLANNING off and no planner pool replay exactly, the other two
+# depend on timing.
+RECORD_PATH = None
+
+# Keep the enemy's tree between replans and re-root it instead of growing a new one every time
+WARM_START = True
+
+# Run the planner as a background asyncio task that gets PLAN_BUDGET_US microseconds per frame
+# instead of doing all of its iterations inside one update. Once a path is found it keeps refining
+# for up to PLAN_REFINE_ITERATIONS more iterations and publishes anything shorter.
+ASYNC_PLANNING = True
+PLAN_BUDGET_US = 4000
+PLAN_REFINE_ITERATIONS = 20
+
+# "object" is the RRTStar below, one Python object per node. "array" is ArrayRRTStar, which keeps
+# the tree in preallocated NumPy arrays and copes much better with a higher iteration cap.
+TREE_BACKEND = "object"
+MAX_PLAN_ITERATIONS = 500
+
+# Once RRT* has a path, refinement only samples the ellipse of points that could shorten it. Pays
+# off with cold starts, but on a warm tree the extra nodes it packs into the ellipse make rewiring
+# cost more than the shorter paths save, so it's off by default (benchmark.py --refine N --informed).
+# ADAPTIVE_GOAL_BIAS lets the goal bias drift with how often steps straight at the goal succeed.
+INFORMED_SAMPLING = False
+ADAPTIVE_GOAL_BIAS = False
+
+# Lazy RRT*: grow and rewire the tree checking only node positions and leave edge checks until an
+# edge is on a path the planner is about to return
+LAZY_EDGES = False
+
+# RRT*'s rewiring on both trees of PLANNER = "rrtconnect". Off gives plain RRT-Connect, which finds a
+# first path a bit sooner but a longer one.
+CONNECT_REWIRE = True
+
+# When an enemy asks for a new path. "cooldown" replans every REPLAN_RATE frames whatever happened.
+# "events" keeps the path until it stops being good enough: the player is more than REPLAN_DISTANCE
+# from where the path was planned to, the next step along it is blocked, or the enemy hasn't moved
+# for STUCK_REPLAN_FRAMES. Smaller player moves only get the end of the path pointed at them again.
+REPLAN_TRIGGER = "events"
+REPLAN_RATE = 15
+REPLAN_DISTANCE = 60
+STUCK_REPLAN_FRAMES = 6
+
+# Play a level file (see levels.py) instead of the map rolled from the seed. The planning data built
+# from its layout is baked into LEVEL_CACHE the first time and memory-mapped from there after that,
+# ship the cache next to the level to skip the work entirely (e.g. in the browser build).
+LEVEL_PATH = None
+LEVEL_CACHE = levels.DEFAULT_CACHE
+
+# Which planner the enemies use, see PLANNERS. "rrtstar" grows a sampled tree on every replan,
+# "visibility" runs A* on a graph over the obstacle corners that is built once per map and "prm"
+# runs A* on a shared random roadmap (prm.py) that is built once and grown when a query needs it.
+# "rrtconnect" grows a tree from the enemy and one from the player and joins them (RRT-Connect).
+PLANNER = "rrtstar"
+
+# "planner" has every enemy plan its own path with PLANNER. "flowfield" shares one distance field
+# over a grid, rebuilt when the player changes cells, that all enemies just walk down.
+PURSUIT = "planner"
+
+# Number of chasers. Their replans are spread over REPLAN_RATE frames and at most REPLANS_PER_FRAME
+# of them may start planning in the same frame. With PLANNER_WORKERS > 0 the plans run on a
+# process pool instead of the main thread (not available in the browser build, which has no
+# processes, so it falls back to the settings above there).
+ENEMY_COUNT = 1
+REPLANS_PER_FRAME = 2
+PLANNER_WORKERS = 0
+
+# Timers around the planner, collision checks, enemy updates and drawing. P toggles them and their
+# stats line in game, PROFILE turns them on from the start. With PROFILE_TRACE set to a .csv or
+# .json path every profiled frame gets written there when the game exits.
+PROFILE = False
+PROFILE_TRACE = None
+
 # Colors
 WHITE = (255, 255, 255)
 BLACK = (20, 20, 20)
@@ -26,26 +124,32 @@ GRAY = (100, 100, 100)
 YELLOW = (200, 200, 50)
 CYAN = (50, 200, 200)
 ORANGE = (255, 165, 0)
+TREE_EDGE_COLOR = (50, 50, 150)
+TREE_NODE_COLOR = (0, 0, 255)
+# Never drawn by anything, marks the see-through part of the tree overlay
+OVERLAY_KEY = (255, 0, 255)
+# A rewired tree has to be redrawn from scratch, don't do that more often than this
+OVERLAY_REBUILD_FRAMES = 6
+# Cell size of the grid the scrolling view uses to find the obstacles on screen
+VIEW_CULL_CELL = 256
 
 class Player(pygame.sprite.Sprite):
-    def __init__(self, x, y, obstacles):
+    def __init__(self, x, y, collision_map):
         super().__init__()
         self.image = pygame.Surface((30, 30))
         self.image.fill(GREEN)
         self.rect = self.image.get_rect(center=(x, y))
         self.pos = pygame.math.Vector2(x, y)
-        self.obstacles = obstacles
+        self.collision_map = collision_map
 
     def is_collision_free(self, test_pos):
         """Check if a position is free of obstacles"""
-        test_rect = pygame.Rect(test_pos.x - 15, test_pos.y - 15, 30, 30)
-        for obs in self.obstacles:
-            if test_rect.colliderect(obs.rect):
-                return False
-        return True
+        return self.collision_map.is_point_free(test_pos)
 
-    def update(self, player_speed):
-        keys = pygame.key.get_pressed()
+    # keys defaults to the keyboard, anything indexable by key code works (scripted input for benchmarks)
+    def update(self, player_speed, keys=None):
+        if keys is None:
+            keys = pygame.key.get_pressed()
         move = pygame.math.Vector2(0, 0)
 
         if keys[pygame.K_w] or keys[pygame.K_UP]: move.y = -1
@@ -57,8 +161,8 @@ class Player(pygame.sprite.Sprite):
             move = move.normalize() * player_speed
             new_pos = self.pos + move
 
-            new_pos.x = max(15, min(WIDTH - 15, new_pos.x))
-            new_pos.y = max(15, min(HEIGHT - 15, new_pos.y))
+            new_pos.x = max(15, min(self.collision_map.width - 15, new_pos.x))
+            new_pos.y = max(15, min(self.collision_map.height - 15, new_pos.y))
 
             # Only move if collision-free
             if self.is_collision_free(new_pos):
@@ -89,47 +193,74 @@ class RRTNode:
         self.parent = None
         self.children = []
         self.cost = 0  
+        # Whether the edge from parent to this node has been collision checked, see RRTStar.lazy
+        self.verified = True
 
 class RRTStar:
-    def __init__(self, start_pos, obstacles, max_distance=80, goal_bias=0.3):
+    def __init__(self, start_pos, collision_map, max_distance=80, goal_bias=0.3, rewire_radius=150,
+                 adaptive_bias=False, lazy=False):
         self.root = RRTNode(start_pos)
         self.root.cost = 0
         self.nodes = [self.root]
-        self.obstacles = obstacles
+        # Grid index kept in sync with self.nodes so nearest/nearby lookups don't scan every node
+        self.index = SpatialGrid()
+        self.index.insert(self.root)
+        # Bumped whenever existing edges change (rewire, reroot, prune). Appending nodes doesn't bump
+        # it, so the renderer can tell "only new nodes" apart from "redraw everything".
+        self.revision = 0
+        self.collision_map = collision_map
         self.max_distance = max_distance
         self.goal_bias = goal_bias
+        self.adaptive_bias = AdaptiveGoalBias(goal_bias) if adaptive_bias else None
+        self.rewire_radius = rewire_radius
+        # Lazy RRT*. New and rewired edges only get their end point checked, the edge itself is
+        # checked when it ends up on a path that get_path hands out. Most edges never do.
+        self.lazy = lazy
 
     def is_position_valid(self, pos):
-        test_rect = pygame.Rect(pos.x - 15, pos.y - 15, 30, 30)
-        for obs in self.obstacles:
-            if test_rect.colliderect(obs.rect):
-                return False
-        return True
+        return self.collision_map.is_point_free(pos)
 
-    def is_path_clear(self, start_pos, end_pos, steps=10):
-        for i in range(steps):
-            t = i / steps
-            check_pos = start_pos + (end_pos - start_pos) * t
-            if not self.is_position_valid(check_pos):
-                return False
-        return True
+    # Used to sample 10 points along the edge, which could step over the corner of an obstacle.
+    # The collision map does an exact segment test instead.
+    def is_path_clear(self, start_pos, end_pos):
+        return self.collision_map.is_path_clear(start_pos, end_pos)
+
+    def get_nearby_nodes(self, pos, radius=None):
+        return self.index.within(pos, self.rewire_radius if radius is None else radius)
+
+    def add_node(self, node):
+        self.nodes.append(node)
+        self.index.insert(node)
 
-    def get_nearby_nodes(self, pos, radius=150):
-        return [n for n in self.nodes if n.pos.distance_to(pos) < radius]
+    def __len__(self):
+        return len(self.nodes)
 
     # I think that making this a * algorithm was a bit unnecessary since we move too quickly for rewiring to 
     # show significant effects but I did notice that this made my paths significantly faster. Much of this is 
     # based on my assignment code
     def rewire(self, new_node, nearby_nodes):
-        for node in nearby_nodes:
+        # Costs only go down during the pass, so anything that isn't an improvement now won't be later.
+        # The rest get their collision checks done in one batch up front.
+        candidates = [n for n in nearby_nodes if new_node.cost + new_node.pos.distance_to(n.pos) < n.cost]
+        if not candidates:
+            return
+        start = (new_node.pos.x, new_node.pos.y)
+        if self.lazy:
+            clear = [True] * len(candidates)
+        else:
+            clear = self.collision_map.paths_clear([start] * len(candidates), [(n.pos.x, n.pos.y) for n in candidates])
+
+        for node, is_clear in zip(candidates, clear):
             new_cost = new_node.cost + new_node.pos.distance_to(node.pos)
-            if new_cost < node.cost and self.is_path_clear(new_node.pos, node.pos):
+            if new_cost < node.cost and is_clear:
 
                 if node.parent:
                     node.parent.children.remove(node)
                 node.parent = new_node
                 new_node.children.append(node)
                 node.cost = new_cost
+                node.verified = not self.lazy
+                self.revision += 1
 
                 self._update_descendant_costs(node)
 
@@ -138,50 +269,98 @@ class RRTStar:
             child.cost = node.cost + node.pos.distance_to(child.pos)
             self._update_descendant_costs(child)
 
-    def extend(self, target_pos, max_iterations=1):
+    # With best_cost (length of the best path so far) samples come from the informed ellipse instead
+    # of the whole map, nothing outside it can make the path any shorter.
+    def extend(self, target_pos, max_iterations=1, best_cost=None):
         for _ in range(max_iterations):
-            if random.random() < self.goal_bias:
+            bias = self.goal_bias if self.adaptive_bias is None else self.adaptive_bias.value
+            towards_goal = random.random() < bias
+            if towards_goal:
                 sample = pygame.math.Vector2(target_pos)
+            elif best_cost is not None:
+                sample = pygame.math.Vector2(informed_sample(self.root.pos, target_pos, best_cost))
             else:
                 sample = pygame.math.Vector2(
-                    random.uniform(0, WIDTH),
-                    random.uniform(0, HEIGHT)
+                    random.uniform(0, self.collision_map.width),
+                    random.uniform(0, self.collision_map.height)
                 )
 
-            nearest_node = min(self.nodes, key=lambda n: n.pos.distance_to(sample))
-            
-            direction = sample - nearest_node.pos
-            if direction.length() > 0:
-                direction = direction.normalize()
-            
-            step = min(self.max_distance, (sample - nearest_node.pos).length())
-            new_pos = nearest_node.pos + direction * step
-            
-            new_pos.x = max(15, min(WIDTH - 15, new_pos.x))
-            new_pos.y = max(15, min(HEIGHT - 15, new_pos.y))
+            nearest_node = self.index.nearest(sample)
+            new_pos = self.step_towards(nearest_node, sample)
 
-            if self.is_path_clear(nearest_node.pos, new_pos) and self.is_position_valid(new_pos):
+            if self.lazy:
+                extended = self.is_position_valid(new_pos)
+            else:
+                extended = self.is_path_clear(nearest_node.pos, new_pos) and self.is_position_valid(new_pos)
+            if towards_goal and self.adaptive_bias is not None:
+                self.adaptive_bias.update(extended)
+            if extended:
                 new_node = RRTNode(new_pos)
                 new_node.cost = nearest_node.cost + nearest_node.pos.distance_to(new_pos)
                 new_node.parent = nearest_node
+                new_node.verified = not self.lazy
                 nearest_node.children.append(new_node)
-                self.nodes.append(new_node)
+                self.add_node(new_node)
                 
                 nearby_nodes = self.get_nearby_nodes(new_pos)
                 self.rewire(new_node, nearby_nodes)
 
                 if new_pos.distance_to(target_pos) < self.max_distance:
-                    if self.is_path_clear(new_pos, target_pos) and self.is_position_valid(target_pos):
+                    if (self.lazy or self.is_path_clear(new_pos, target_pos)) and self.is_position_valid(target_pos):
                         goal_node = RRTNode(target_pos)
                         goal_node.cost = new_node.cost + new_node.pos.distance_to(target_pos)
                         goal_node.parent = new_node
+                        goal_node.verified = not self.lazy
                         new_node.children.append(goal_node)
-                        self.nodes.append(goal_node)
+                        self.add_node(goal_node)
                         return self.get_path(goal_node)
 
         return None
 
+    def step_towards(self, node, sample):
+        """Where a step of at most max_distance from node towards sample ends up, kept inside the map"""
+        direction = sample - node.pos
+        if direction.length() > 0:
+            direction = direction.normalize()
+        
+        step = min(self.max_distance, (sample - node.pos).length())
+        new_pos = node.pos + direction * step
+        
+        new_pos.x = max(15, min(self.collision_map.width - 15, new_pos.x))
+        new_pos.y = max(15, min(self.collision_map.height - 15, new_pos.y))
+        return new_pos
+
+    # RRT-Connect's two moves (see RRTConnectPlanner). Edges are always checked, lazy only applies to extend.
+
+    def grow_towards(self, node, sample, rewire=True):
+        """Adds one step from node towards sample, returns the new node or None if the step is blocked"""
+        new_pos = self.step_towards(node, sample)
+        if not (self.is_path_clear(node.pos, new_pos) and self.is_position_valid(new_pos)):
+            return None
+        new_node = RRTNode(new_pos)
+        new_node.cost = node.cost + node.pos.distance_to(new_pos)
+        new_node.parent = node
+        node.children.append(new_node)
+        self.add_node(new_node)
+        if rewire:
+            self.rewire(new_node, self.get_nearby_nodes(new_pos))
+        return new_node
+
+    def connect(self, target_pos, rewire=True):
+        """Keeps stepping towards target_pos until the tree reaches it or hits something.
+        Returns the node at target_pos, or None"""
+        target_pos = pygame.math.Vector2(target_pos)
+        while True:
+            nearest_node = self.index.nearest(target_pos)
+            if nearest_node.pos.distance_to(target_pos) < 1e-6:
+                return nearest_node
+            if self.grow_towards(nearest_node, target_pos, rewire) is None:
+                return None
+
+    # With lazy on this checks the path's edges first and returns None if node couldn't stay connected
     def get_path(self, node):
+        if self.lazy and not self.verify_path(node):
+            return None
         path = []
         current = node
         while current is not None:
@@ -190,31 +369,372 @@ class RRTStar:
         path.reverse()
         return path
 
-    def get_tree_edges(self):
+    def verify_path(self, node):
+        """Checks the unchecked edges between node and the root. Blocked ones get repaired or cut off,
+        returns True if node is still connected by checked edges afterwards"""
+        while True:
+            unchecked = []
+            current = node
+            while current.parent is not None:
+                if not current.verified:
+                    unchecked.append(current)
+                current = current.parent
+            if current is not self.root:
+                # Dropped by an earlier repair
+                return False
+            if not unchecked:
+                return True
+
+            clear = self.collision_map.paths_clear([(n.parent.pos.x, n.parent.pos.y) for n in unchecked],
+                                                   [(n.pos.x, n.pos.y) for n in unchecked])
+            blocked = []
+            for child, is_clear in zip(unchecked, clear):
+                if is_clear:
+                    child.verified = True
+                else:
+                    blocked.append(child)
+            # Closest to the root first, a repair there may already have dealt with the rest
+            for child in reversed(blocked):
+                if child.parent is not None and not child.verified:
+                    self.repair(child)
+
+    def repair(self, node):
+        """Replaces node's blocked parent edge with the cheapest clear one, or drops node's whole subtree"""
+        blocked_parent = node.parent
+        blocked_parent.children.remove(node)
+        node.parent = None
+        subtree = set()
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            subtree.add(current)
+            stack.extend(current.children)
+
+        candidates = [n for n in self.get_nearby_nodes(node.pos) if n not in subtree and n is not blocked_parent]
+        candidates.sort(key=lambda n: n.cost + n.pos.distance_to(node.pos))
+        clear = self.collision_map.paths_clear([(n.pos.x, n.pos.y) for n in candidates],
+                                               [(node.pos.x, node.pos.y)] * len(candidates))
+        self.revision += 1
+        for parent, is_clear in zip(candidates, clear):
+            if is_clear:
+                node.parent = parent
+                parent.children.append(node)
+                node.cost = parent.cost + parent.pos.distance_to(node.pos)
+                node.verified = True
+                self._update_descendant_costs(node)
+                return True
+
+        for removed in subtree:
+            self.index.remove(removed)
+            removed.parent = None
+            removed.children = []
+        self.nodes = [n for n in self.nodes if n not in subtree]
+        return False
+
+    # start skips the first nodes, used to fetch only what was added since the last draw
+    def get_tree_edges(self, start=0):
         edges = []
-        for node in self.nodes:
+        for node in self.nodes[start:]:
             if node.parent:
                 edges.append((node.parent.pos, node.pos))
         return edges
 
+    def get_node_positions(self, start=0):
+        return [node.pos for node in self.nodes[start:]]
+
+    # Warm start. The obstacles never move so every edge in the tree stays valid between replans,
+    # only the root (where the enemy is) and the goal (where the player is) change. Instead of
+    # throwing the tree away we hang it off a new root at the enemy's position. Returns False if
+    # the new position can't be connected to the tree, in which case the caller should start over.
+    def reroot(self, new_pos, max_nodes=1500):
+        new_pos = pygame.math.Vector2(new_pos)
+        if not self.is_position_valid(new_pos):
+            return False
+
+        anchor = self.index.nearest(new_pos)
+        if not self.is_path_clear(new_pos, anchor.pos):
+            candidates = self.get_nearby_nodes(new_pos, self.max_distance)
+            candidates.sort(key=lambda n: n.pos.distance_to(new_pos))
+            anchor = next((n for n in candidates if self.is_path_clear(new_pos, n.pos)), None)
+            if anchor is None:
+                return False
+
+        # Flip the parent links from the anchor up to the old root so the anchor's ancestors
+        # become its descendants. Edges are undirected so they're all still collision-free.
+        previous = None
+        node = anchor
+        # Each edge's checked flag lives on its child end, so it moves one step along with the flip.
+        # The anchor's new edge to the root was just checked.
+        verified = True
+        while node is not None:
+            parent = node.parent
+            if previous is not None:
+                node.children.remove(previous)
+                previous.children.append(node)
+            node.parent = previous
+            node.verified, verified = verified, node.verified
+            previous = node
+            node = parent
+
+        if anchor.pos.distance_to(new_pos) > 1e-6:
+            new_root = RRTNode(new_pos)
+            anchor.parent = new_root
+            new_root.children.append(anchor)
+            self.add_node(new_root)
+        else:
+            new_root = anchor
+        self.root = new_root
+        self.root.cost = 0
+        self._update_descendant_costs(self.root)
+        self.revision += 1
+
+        self.prune(max_nodes)
+        self.rewire(self.root, self.get_nearby_nodes(self.root.pos))
+        return True
+
+    # Drops the most expensive leaves until the tree fits in max_nodes. Only leaves are ever removed
+    # so everything left is still connected to the root.
+    def prune(self, max_nodes):
+        excess = len(self.nodes) - max_nodes
+        if excess <= 0:
+            return
+
+        removed = set()
+        leaves = [(-n.cost, id(n), n) for n in self.nodes if not n.children and n is not self.root]
+        heapq.heapify(leaves)
+        while leaves and len(removed) < excess:
+            _, _, node = heapq.heappop(leaves)
+            parent = node.parent
+            parent.children.remove(node)
+            node.parent = None
+            self.index.remove(node)
+            removed.add(node)
+            if not parent.children and parent is not self.root:
+                heapq.heappush(leaves, (-parent.cost, id(parent), parent))
+
+        self.nodes = [n for n in self.nodes if n not in removed]
+        self.revision += 1
+
+    # With a reused tree there's usually already a node close to the player, so try to finish
+    # straight away before spending iterations on extend.
+    def connect_goal(self, target_pos):
+        if not self.is_position_valid(target_pos):
+            return None
+
+        nearby = self.get_nearby_nodes(target_pos, self.max_distance)
+        if not nearby:
+            return None
+        target = (target_pos[0], target_pos[1])
+        clear = self.collision_map.paths_clear([(n.pos.x, n.pos.y) for n in nearby], [target] * len(nearby))
+
+        best = None
+        best_cost = math.inf
+        for node, is_clear in zip(nearby, clear):
+            cost = node.cost + node.pos.distance_to(target_pos)
+            if cost < best_cost and is_clear:
+                best, best_cost = node, cost
+        if best is None:
+            return None
+
+        goal_node = RRTNode(target_pos)
+        goal_node.cost = best_cost
+        goal_node.parent = best
+        best.children.append(goal_node)
+        self.add_node(goal_node)
+        return self.get_path(goal_node)
+
+# Planner backends. Enemy only talks to its planner through:
+#   plan_steps(start, goal, refine_iterations=0)  generator yielding the best path so far, a list of
+#                                                 Vector2 from start to goal or None. It runs the same
+#                                                 whether it's drained at once or a slice per frame
+#   iterations                                    work done by the last plan, for the stats
+#   tree                                          what the debug view draws (revision, len(),
+#                                                 get_tree_edges, get_node_positions), None until the
+#                                                 first plan
+
+class RRTStarPlanner:
+    # A higher bias makes sense for this environment. From trial and error, lower bias trees
+    # tended to loop strangely if you were far from them. sweep.py tries other values.
+    def __init__(self, collision_map, tree_backend=TREE_BACKEND, warm_start=WARM_START,
+                 goal_bias=0.35, max_distance=80, rewire_radius=150, max_iterations=None,
+                 informed=INFORMED_SAMPLING, adaptive_bias=ADAPTIVE_GOAL_BIAS, lazy=LAZY_EDGES):
+        self.collision_map = collision_map
+        self.tree_backend = tree_backend
+        self.warm_start = warm_start
+        self.informed = informed
+        self.tree_options = {"max_distance": max_distance, "goal_bias": goal_bias,
+                             "rewire_radius": rewire_radius, "adaptive_bias": adaptive_bias, "lazy": lazy}
+        self.max_iterations = MAX_PLAN_ITERATIONS if max_iterations is None else max_iterations
+        self.tree = None
+        self.iterations = 0
+
+    def new_tree(self, start):
+        if self.tree_backend == "array":
+            # Reuse the existing buffers rather than allocating a new set
+            if isinstance(self.tree, ArrayRRTStar):
+                self.tree.reset(start)
+                return self.tree
+            return ArrayRRTStar(start, self.collision_map, **self.tree_options)
+        return RRTStar(start, self.collision_map, **self.tree_options)
+
+    # Yields after every iteration and stops once it has spent refine_iterations looking for
+    # something shorter than the first path.
+    def plan_steps(self, start, goal, refine_iterations=0):
+        goal = pygame.math.Vector2(goal)
+        best = None
+        self.iterations = 0
+        if self.warm_start and self.tree is not None and self.tree.reroot(start):
+            best = self.tree.connect_goal(goal)
+            yield best
+        else:
+            self.tree = self.new_tree(start)
+        best_cost = path_length(best) if best else None
+
+        remaining = refine_iterations
+        for _ in range(self.max_iterations):
+            if best:
+                if remaining <= 0:
+                    break
+                remaining -= 1
+            path = self.tree.extend(goal, max_iterations=1, best_cost=best_cost if self.informed else None)
+            self.iterations += 1
+            if path:
+                cost = path_length(path)
+                if best is None or cost < best_cost:
+                    best, best_cost = path, cost
+            yield best
+
+class TreePair:
+    """RRT-Connect's two trees drawn as one, see the planner protocol above"""
+    def __init__(self, first, second):
+        self.first = first
+        self.second = second
+
+    @property
+    def revision(self):
+        # Nodes are listed first tree first, so the second tree's only stay put while the first doesn't grow
+        return (self.first.revision, self.second.revision, len(self.first))
+
+    def __len__(self):
+        return len(self.first) + len(self.second)
+
+    def get_tree_edges(self, start=0):
+        return self._split(start, "get_tree_edges")
+
+    def get_node_positions(self, start=0):
+        return self._split(start, "get_node_positions")
+
+    def _split(self, start, method):
+        first = len(self.first)
+        if start >= first:
+            return getattr(self.second, method)(start - first)
+        return getattr(self.first, method)(start) + getattr(self.second, method)()
+
+class RRTConnectPlanner:
+    """Bidirectional RRT-Connect. One tree grows from the enemy and one from the player, they take turns
+    growing a step towards a random sample and the other one then heads for the new node in a straight
+    run of steps until it gets there or hits something. Around obstacles that finds a path in far
+    fewer iterations than one tree waiting to sample its way to the player. With rewire on both trees
+    get RRT*'s rewiring (RRT*-Connect), and refine time keeps looking for shorter connections."""
+    def __init__(self, collision_map, warm_start=WARM_START, rewire=CONNECT_REWIRE, max_distance=80,
+                 rewire_radius=150, max_iterations=None):
+        self.collision_map = collision_map
+        self.warm_start = warm_start
+        self.rewire = rewire
+        self.tree_options = {"max_distance": max_distance, "rewire_radius": rewire_radius}
+        self.max_iterations = MAX_PLAN_ITERATIONS if max_iterations is None else max_iterations
+        self.start_tree = None
+        self.goal_tree = None
+        self.tree = None
+        self.iterations = 0
+
+    def plan_steps(self, start, goal, refine_iterations=0):
+        goal = pygame.math.Vector2(goal)
+        best = None
+        self.iterations = 0
+        if not self.collision_map.is_point_free(goal):
+            yield None
+            return
+        # Only the enemy's tree is kept. The player's re-rooted at where the player is now is full of
+        # detours that end up in the joined paths, a new one is cheap and gives shorter paths.
+        if self.warm_start and self.start_tree is not None and self.start_tree.reroot(start):
+            best = self.start_tree.connect_goal(goal)
+            yield best
+        else:
+            self.start_tree = RRTStar(start, self.collision_map, **self.tree_options)
+        self.goal_tree = RRTStar(goal, self.collision_map, **self.tree_options)
+        self.tree = TreePair(self.start_tree, self.goal_tree)
+        best_cost = path_length(best) if best else None
+
+        growing, other = self.start_tree, self.goal_tree
+        remaining = refine_iterations
+        for _ in range(self.max_iterations):
+            if best:
+                if remaining <= 0:
+                    break
+                remaining -= 1
+            sample = pygame.math.Vector2(
+                random.uniform(0, self.collision_map.width),
+                random.uniform(0, self.collision_map.height)
+            )
+            new_node = growing.grow_towards(growing.index.nearest(sample), sample, self.rewire)
+            self.iterations += 1
+            if new_node is not None:
+                meeting = other.connect(new_node.pos, self.rewire)
+                if meeting is not None:
+                    path = self.join(new_node, meeting) if growing is self.start_tree else self.join(meeting, new_node)
+                    cost = path_length(path)
+                    if best is None or cost < best_cost:
+                        best, best_cost = path, cost
+            growing, other = other, growing
+            yield best
+
+    def join(self, start_node, goal_node):
+        # Both nodes sit at the same spot, so the goal tree's half starts one node further along
+        return self.start_tree.get_path(start_node) + self.goal_tree.get_path(goal_node)[::-1][1:]
+
+PLANNERS = {
+    "rrtstar": RRTStarPlanner,
+    "rrtconnect": RRTConnectPlanner,
+    "visibility": VisibilityGraphPlanner,
+    "prm": PRMPlanner,
+}
+
+def make_planner(kind, collision_map, **options):
+    """Options are passed through to the backend's constructor"""
+    return PLANNERS[kind](collision_map, **options)
+
 # This enemy class movement is based on another project that I was working on. Adapted to fix this. 
 class Enemy(pygame.sprite.Sprite):
-    def __init__(self, x, y, obstacles):
+    def __init__(self, x, y, collision_map, planner=None):
         super().__init__()
         self.image = pygame.Surface((30, 30))
         self.image.fill(RED)
         self.rect = self.image.get_rect(center=(x, y))
         self.pos = pygame.math.Vector2(x, y)
         self.vel = pygame.math.Vector2(0, 0)
-        self.obstacles = obstacles
+        self.collision_map = collision_map
         
-        # RRT* variables are defined here. A higher bias makes sense for this environment.
-        # From trial and error, lower bias trees tended to loop strangely if you were far from them.
-        self.rrt = RRTStar(self.pos, obstacles, max_distance=80, goal_bias=0.35)
+        # Anything from PLANNERS, the rest of the class only goes through plan_steps
+        self.planner = planner or make_planner(PLANNER, collision_map)
         self.path = []
         self.path_index = 0
         self.replan_cooldown = 0
-        self.REPLAN_RATE = 15
+        self.REPLAN_RATE = REPLAN_RATE
+        self.replan_trigger = REPLAN_TRIGGER
+        self.replan_distance = REPLAN_DISTANCE
+        self.stuck_replan_frames = STUCK_REPLAN_FRAMES
+        # Where the current path was planned to, and whether something has happened that it can't handle
+        self.planned_goal = None
+        self.needs_replan = False
+        self.async_planning = ASYNC_PLANNING
+        self.plan_task = None
+        self.scheduler = None
+        self.planner_pool = None
+        self.plan_pending = False
+        self.plan_generation = 0
+        # Set when following a shared FlowField instead of planning
+        self.flow_field = None
         
         # Handles niche edge cases where the square gets stuck in a weird position. The functions for that are directly below this. 
         self.last_pos = pygame.math.Vector2(x, y)
@@ -225,15 +745,107 @@ class Enemy(pygame.sprite.Sprite):
         self.collision_avoidance_dir = None
 
     def is_collision_free(self, test_pos):
-        if (test_pos.x < 15 or test_pos.x > WIDTH - 15 or 
-            test_pos.y < 15 or test_pos.y > HEIGHT - 15):
-            return False
+        return self.collision_map.in_bounds(test_pos) and self.collision_map.is_point_free(test_pos)
+
+    # Every way of running a plan (sync, time-sliced, benchmark) drives this same generator
+    def plan_steps(self, player_pos, refine_iterations=0):
+        return self.planner.plan_steps(self.pos, player_pos, refine_iterations)
+
+    def replan(self, player_pos):
+        path = None
+        for path in self.plan_steps(player_pos):
+            pass
+        if path:
+            self.set_path(path)
+
+    def set_path(self, path, skip_start=False):
+        self.path = path
+        # An async plan starts where the enemy was a few frames ago, so don't walk back to it
+        self.path_index = 1 if skip_start and len(path) > 1 else 0
+        self.collision_avoidance_dir = None
 
-        test_rect = pygame.Rect(test_pos.x - 15, test_pos.y - 15, 30, 30)
-        for obs in self.obstacles:
-            if test_rect.colliderect(obs.rect):
-                return False
-        return True
+    # All running plan tasks share the one per-frame budget
+    active_plan_tasks = 0
+
+    async def plan_async(self, player_pos):
+        deadline = time.perf_counter() + self.plan_slice()
+        published = None
+        try:
+            for path in self.plan_steps(player_pos, PLAN_REFINE_ITERATIONS):
+                if path is not published:
+                    self.set_path(path, skip_start=True)
+                    published = path
+                if time.perf_counter() >= deadline:
+                    await asyncio.sleep(0)
+                    deadline = time.perf_counter() + self.plan_slice()
+        except Exception:
+            # Give up the slot so the enemy can plan again, cancel_planning does this on a cancel
+            self.plan_task = None
+            Enemy.active_plan_tasks -= 1
+            raise
+        self.plan_task = None
+        Enemy.active_plan_tasks -= 1
+
+    def plan_slice(self):
+        return PLAN_BUDGET_US / 1_000_000 / max(1, Enemy.active_plan_tasks)
+
+    def start_planning(self, player_pos):
+        if self.plan_task is None:
+            Enemy.active_plan_tasks += 1
+            self.plan_task = asyncio.get_running_loop().create_task(self.plan_async(player_pos))
+
+    def cancel_planning(self):
+        if self.plan_task is not None:
+            self.plan_task.cancel()
+            self.plan_task = None
+            Enemy.active_plan_tasks -= 1
+        if self.planner_pool is not None:
+            self.planner_pool.cancel(self)
+
+    def request_replan(self, player_pos):
+        if self.planner_pool is not None:
+            if self.plan_pending:
+                return
+            self.planner_pool.request(self, player_pos)
+        elif self.async_planning:
+            # Keeps following the old path while the task works, the new one replaces it when ready
+            if self.plan_task is not None:
+                return
+            self.start_planning(player_pos)
+        else:
+            self.replan(player_pos)
+        self.replan_cooldown = self.REPLAN_RATE
+        self.planned_goal = pygame.math.Vector2(player_pos)
+        self.needs_replan = False
+
+    def replan_needed(self, player_pos):
+        """For the "events" trigger. Patches the end of the path if that's all it needs."""
+        if self.plan_task is not None or self.plan_pending:
+            # One is on its way already
+            return False
+        if not self.path or self.needs_replan:
+            return True
+        if self.planned_goal is None or self.planned_goal.distance_to(player_pos) > self.replan_distance:
+            return True
+        return not self.patch_tail(player_pos)
+
+    def patch_tail(self, player_pos):
+        """Points the end of the path at the player, returns False if it can't be done with a straight line"""
+        end = self.path[-1]
+        if end == player_pos:
+            return True
+        goal = pygame.math.Vector2(player_pos)
+        remaining = len(self.path) - self.path_index
+        # Swap the last waypoint for the player if the one before can see them, else add them after it.
+        # The path is replaced rather than edited since the planner may still be holding on to it.
+        anchor = self.path[-2] if remaining >= 2 else self.pos
+        if self.collision_map.is_segment_free(anchor, goal):
+            self.path = self.path[:-1] + [goal] if remaining >= 1 else self.path + [goal]
+            return True
+        if remaining >= 1 and self.collision_map.is_segment_free(end, goal):
+            self.path = self.path + [goal]
+            return True
+        return False
 
     def get_random_recovery_dir(self):
         angle = random.uniform(0, 2 * math.pi)
@@ -250,12 +862,16 @@ class Enemy(pygame.sprite.Sprite):
         return None
 
     def update(self, player_pos, enemy_speed):
-        if self.pos.distance_to(self.last_pos) < 1.0 and not self.is_recovering:
+        # Standing still because the first async plan isn't ready yet isn't being stuck
+        waiting_for_plan = (self.plan_task is not None or self.plan_pending) and not self.path
+        if self.pos.distance_to(self.last_pos) < 1.0 and not self.is_recovering and not waiting_for_plan:
             self.stuck_counter += 1
         else:
             self.stuck_counter = 0
             
         self.last_pos = pygame.math.Vector2(self.pos)
+        if self.stuck_counter == self.stuck_replan_frames:
+            self.needs_replan = True
 
         if self.stuck_counter > 18:
             self.is_recovering = True
@@ -263,13 +879,13 @@ class Enemy(pygame.sprite.Sprite):
             self.recovery_dir = self.get_random_recovery_dir()
             self.stuck_counter = 0
             self.image.fill(ORANGE)
+            self.cancel_planning()
 
         if self.is_recovering:
             self.recovery_timer -= 1
             if self.recovery_timer <= 0:
                 self.is_recovering = False
                 self.image.fill(RED)
-                self.rrt = RRTStar(self.pos, self.obstacles, max_distance=80, goal_bias=0.35)
                 self.path = []
                 self.collision_avoidance_dir = None
             else:
@@ -282,17 +898,23 @@ class Enemy(pygame.sprite.Sprite):
             self.rect.center = round(self.pos.x), round(self.pos.y)
             return
 
-        self.replan_cooldown -= 1
-        if self.replan_cooldown <= 0 or not self.path:
-            self.rrt = RRTStar(self.pos, self.obstacles, max_distance=80, goal_bias=0.35)
-            for _ in range(500): 
-                path = self.rrt.extend(player_pos, max_iterations=1)
-                if path:
-                    self.path = path
-                    self.path_index = 0
-                    self.collision_avoidance_dir = None
-                    break
-            self.replan_cooldown = self.REPLAN_RATE
+        if self.flow_field is not None:
+            # Nothing to plan, just head for the next cell downhill from here
+            waypoint = self.flow_field.waypoint(self.pos)
+            self.path = [pygame.math.Vector2(waypoint)] if waypoint else []
+            self.path_index = 0
+        else:
+            self.replan_cooldown -= 1
+            if self.replan_trigger == "events":
+                replan = self.replan_needed(player_pos)
+            else:
+                # A plan that's still on its way would only waste one of the frame's slots
+                replan = ((self.replan_cooldown <= 0 or not self.path)
+                          and self.plan_task is None and not self.plan_pending)
+            if replan:
+                # If this frame's replans are used up, try again next frame
+                if self.scheduler is None or self.scheduler.acquire():
+                    self.request_replan(player_pos)
 
         if self.path and self.path_index < len(self.path):
             target = self.path[self.path_index]
@@ -308,6 +930,8 @@ class Enemy(pygame.sprite.Sprite):
                     self.vel = direction * enemy_speed
                     self.collision_avoidance_dir = None
                 else:
+                    # Knocked off the path, it doesn't lead anywhere from here any more
+                    self.needs_replan = True
                     if self.collision_avoidance_dir is None:
                         self.collision_avoidance_dir = self.find_collision_avoidance_direction()
                     
@@ -325,45 +949,563 @@ class Enemy(pygame.sprite.Sprite):
         
         self.rect.center = round(self.pos.x), round(self.pos.y)
 
-async def main():
-    pygame.init()
-    screen = pygame.display.set_mode((WIDTH, HEIGHT))
-    pygame.display.set_caption("RRT* Chase - Optimized Pathfinding")
-    clock = pygame.time.Clock()
-    font = pygame.font.Font(None, 24)
-    title_font = pygame.font.Font(None, 48)
+class ReplanScheduler:
+    """Caps how many enemies can start a replan in one frame so they don't all land on the same one"""
+    def __init__(self, per_frame):
+        self.per_frame = per_frame
+        self.used = 0
 
-    screen.fill(BLACK)
-    pygame.display.flip()
+    def new_frame(self):
+        self.used = 0
 
-    def spawn_collectibles(collectibles, all_sprites, obstacles):
+    def acquire(self):
+        if self.used >= self.per_frame:
+            return False
+        self.used += 1
+        return True
+
+# Runs enemy replans on worker processes. Requests made during a frame are batched, split across the
+# workers on dispatch(), and the results get picked up by collect() at the start of a later frame.
+# The workers are started by set_map with the map's obstacle rects, each builds its CollisionMap
+# and planner from them once, and batches only name the map. For a level the workers load the same
+# baked data as the game.
+class PlannerPool:
+    def __init__(self, workers, planner_kind=PLANNER):
+        self.workers = workers
+        self.planner_kind = planner_kind
+        self.executor = None
+        self.map_key = None
+        self.queue = []
+        self.in_flight = []
+
+    def set_map(self, collision_map, cache_dir=None):
+        # Imported here, the browser build has no multiprocessing and never gets this far
+        from concurrent.futures import ProcessPoolExecutor
+        map_args = (tuple(collision_map.rects), collision_map.width, collision_map.height, cache_dir)
+        self.map_key = hash(map_args)
+        self.queue = []
+        self.in_flight = []
+        # A new set of workers per map, so the rects are sent once per worker instead of with every batch
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                            initargs=(self.map_key, map_args, self.planner_kind))
+
+    def request(self, enemy, player_pos):
+        enemy.plan_pending = True
+        # Seeded from the game's RNG so a plan depends on the game seed and not on which worker runs it
+        self.queue.append((enemy, enemy.plan_generation, tuple(enemy.pos), tuple(player_pos),
+                           random.getrandbits(32)))
+
+    def cancel(self, enemy):
+        # Anything already on a worker is ignored when it comes back
+        enemy.plan_generation += 1
+        enemy.plan_pending = False
+        self.queue = [job for job in self.queue if job[0] is not enemy]
+
+    def dispatch(self):
+        if not self.queue:
+            return
+        chunk = math.ceil(len(self.queue) / self.workers)
+        for i in range(0, len(self.queue), chunk):
+            jobs = self.queue[i:i + chunk]
+            requests = [(start, goal, seed) for _, _, start, goal, seed in jobs]
+            future = self.executor.submit(plan_batch, self.map_key, requests)
+            self.in_flight.append((future, [(enemy, generation) for enemy, generation, _, _, _ in jobs]))
+        self.queue = []
+
+    def collect(self):
+        still_running = []
+        for future, owners in self.in_flight:
+            if not future.done():
+                still_running.append((future, owners))
+                continue
+            try:
+                paths = future.result()
+            except Exception:
+                # Only this batch's plans are lost, the enemies ask again on their next replan
+                for enemy, generation in owners:
+                    if generation == enemy.plan_generation:
+                        enemy.plan_pending = False
+                continue
+            for (enemy, generation), path in zip(owners, paths):
+                if generation != enemy.plan_generation:
+                    continue
+                enemy.plan_pending = False
+                if path:
+                    enemy.set_path([pygame.math.Vector2(p) for p in path], skip_start=True)
+        self.in_flight = still_running
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+worker_planners = {}
+
+def init_worker(map_key, map_args, planner_kind):
+    # Runs once on every worker process when set_map starts them. Requests come from different
+    # enemies, so a tree kept between them wouldn't help.
+    options = {"warm_start": False} if planner_kind in ("rrtstar", "rrtconnect") else {}
+    rects, width, height, cache_dir = map_args
+    cache = levels.ArtifactCache(cache_dir) if cache_dir else None
+    collision_map = levels.load_collision_map(rects, width, height, cache)
+    if cache is not None:
+        levels.load_roadmap(planner_kind, collision_map, cache)
+    worker_planners[map_key] = make_planner(planner_kind, collision_map, **options)
+
+def plan_batch(map_key, requests):
+    # Runs on a worker process
+    planner = worker_planners[map_key]
+    results = []
+    for start, goal, seed in requests:
+        random.seed(seed)
+        path = None
+        for path in planner.plan_steps(start, goal):
+            pass
+        results.append([tuple(p) for p in path] if path else None)
+    return results
+
+def make_profiler(record_trace=False):
+    return Profiler(
+        timers=[(RRTStar, "extend", "extend"), (ArrayRRTStar, "extend", "extend"),
+                (RRTStar, "rewire", "rewire"), (ArrayRRTStar, "rewire", "rewire"),
+                (CollisionMap, "is_path_clear", "is_path_clear"),
+                # The batched checks count once per segment
+                (CollisionMap, "segments_free", "segments_free", lambda args: len(args[1])),
+                (Enemy, "update", "enemy_update")],
+        planners=[(RRTStarPlanner, "plan_steps"), (RRTConnectPlanner, "plan_steps"),
+                  (GraphPlanner, "plan_steps"), (PRMPlanner, "plan_steps")],
+        record_trace=record_trace)
+
+def make_planner_pool():
+    if PLANNER_WORKERS <= 0 or sys.platform == "emscripten":
+        return None
+    return PlannerPool(PLANNER_WORKERS, PLANNER)
+
+def enemy_spawn_points(count, collision_map):
+    """Corners first, then edge midpoints, then spread around the border, nudged out of obstacles"""
+    inset = 50
+    width, height = collision_map.width, collision_map.height
+    fixed = [(inset, inset), (width - inset, height - inset), (width - inset, inset), (inset, height - inset),
+             (width // 2, inset), (width // 2, height - inset), (inset, height // 2), (width - inset, height // 2)]
+    perimeter = 2 * (width + height - 4 * inset)
+    points = []
+    for i in range(count):
+        if i < len(fixed):
+            x, y = fixed[i]
+        else:
+            # Golden ratio steps keep the extra spawns spread out whatever the count is
+            d = ((i - len(fixed)) * 0.618034 % 1) * perimeter
+            top, side = width - 2 * inset, height - 2 * inset
+            if d < top:
+                x, y = inset + d, inset
+            elif d < top + side:
+                x, y = width - inset, inset + d - top
+            elif d < 2 * top + side:
+                x, y = width - inset - (d - top - side), height - inset
+            else:
+                x, y = inset, height - inset - (d - 2 * top - side)
+        points.append(find_free_position(x, y, collision_map))
+    return points
+
+def find_free_position(x, y, collision_map):
+    for radius in range(0, 200, 10):
+        for step in range(16 if radius else 1):
+            angle = step * math.pi / 8
+            pos = pygame.math.Vector2(x + radius * math.cos(angle), y + radius * math.sin(angle))
+            if collision_map.in_bounds(pos) and collision_map.is_point_free(pos):
+                return round(pos.x), round(pos.y)
+    return x, y
+
+class Camera:
+    """The part of the world the window shows, kept centred on the player and inside the world"""
+    def __init__(self, view_size, world_size):
+        self.view = pygame.Rect((0, 0), view_size)
+        self.world = pygame.Rect((0, 0), world_size)
+
+    @property
+    def scrolls(self):
+        return self.world.width > self.view.width or self.world.height > self.view.height
+
+    def follow(self, pos):
+        self.view.center = (int(pos[0]), int(pos[1]))
+        # A world narrower than the window ends up centred in it
+        self.view.clamp_ip(self.world)
+
+    def to_screen(self, pos):
+        return (int(pos[0]) - self.view.x, int(pos[1]) - self.view.y)
+
+# Draws the playing screen. The background and obstacles never change during a game so they're
+# drawn once into their own surface, and the RRT* trees go in a second cached surface that only gets
+# touched when a tree changes (and then only the new edges if nothing was rewired). Each frame
+# just patches the spots the moving things covered last frame and pushes those rects to the display.
+# A world bigger than the window scrolls instead, and draw_scrolling redraws the whole frame with only
+# what's in view.
+class Renderer:
+    def __init__(self, screen):
+        self.screen = screen
+        self.camera = Camera(screen.get_size(), screen.get_size())
+        self.obstacle_sprites = []
+        self.obstacle_index = None
+        self.background = pygame.Surface(screen.get_size())
+        self.overlay = pygame.Surface(screen.get_size())
+        self.overlay.set_colorkey(OVERLAY_KEY)
+        self.overlay.fill(OVERLAY_KEY)
+        # (tree, revision, node count) per enemy as of the last overlay draw
+        self.overlay_trees = []
+        self.dirty = []
+        self.show_tree = False
+        self.needs_full_redraw = True
+        self.frames_since_rebuild = OVERLAY_REBUILD_FRAMES
+
+    def set_scene(self, obstacles, world_size=None):
+        self.camera = Camera(self.screen.get_size(), world_size or self.screen.get_size())
+        if self.camera.scrolls:
+            # Too big for a prerendered background, only the obstacles in view get drawn each frame
+            self.obstacle_sprites = obstacles.sprites()
+            self.obstacle_index = BoxGrid([(o.rect.left, o.rect.top, o.rect.right, o.rect.bottom)
+                                           for o in self.obstacle_sprites], *world_size, VIEW_CULL_CELL)
+        else:
+            self.obstacle_sprites = []
+            self.obstacle_index = None
+            self.background.fill(BLACK)
+            obstacles.draw(self.background)
+        self.overlay_trees = []
+        self.frames_since_rebuild = OVERLAY_REBUILD_FRAMES
+        self.needs_full_redraw = True
+
+    def invalidate(self):
+        # Something else (menu, game over) drew over the screen
+        self.needs_full_redraw = True
+
+    # Returns the overlay rects that changed, or None if the whole overlay was redrawn
+    def update_overlay(self, enemies):
+        self.frames_since_rebuild += 1
+        # Enemies on a shared graph (prm, visibility) all hold the same one, draw it once
+        trees = {id(enemy.planner.tree): enemy.planner.tree
+                 for enemy in enemies if enemy.planner.tree is not None}
+        state = [(tree, tree.revision, len(tree)) for tree in trees.values()]
+        if state == self.overlay_trees:
+            return []
+
+        # Same trees with no rewiring since last time means only nodes were appended
+        previous = self.overlay_trees
+        incremental = len(state) == len(previous) and all(
+            tree is old_tree and revision == old_revision
+            for (tree, revision, _), (old_tree, old_revision, _) in zip(state, previous))
+        if not incremental:
+            # Leave the slightly stale tree up for a few frames rather than redrawing it every frame
+            if self.frames_since_rebuild < OVERLAY_REBUILD_FRAMES:
+                return []
+            self.overlay.fill(OVERLAY_KEY)
+            self.frames_since_rebuild = 0
+
+        changed = []
+        for i, (tree, _, _) in enumerate(state):
+            start = previous[i][2] if incremental else 0
+            for edge in tree.get_tree_edges(start):
+                changed.append(pygame.draw.line(self.overlay, TREE_EDGE_COLOR, edge[0], edge[1], 1))
+            for pos in tree.get_node_positions(start):
+                changed.append(pygame.draw.circle(self.overlay, TREE_NODE_COLOR, (int(pos[0]), int(pos[1])), 2))
+        self.overlay_trees = state
+        return changed if incremental else None
+
+    def draw(self, player, enemies, collectibles, show_tree, hud, stats=None):
+        if self.camera.scrolls:
+            self.draw_scrolling(player, enemies, collectibles, show_tree, hud, stats)
+            return
+        full = self.needs_full_redraw or show_tree != self.show_tree
+        self.show_tree = show_tree
+        # Last frame's moving things need painting over, plus any new bits of tree
+        restore = list(self.dirty)
+        if show_tree:
+            changed = self.update_overlay(enemies)
+            if changed is None:
+                full = True
+            else:
+                restore.extend(changed)
+
+        if full:
+            self.screen.blit(self.background, (0, 0))
+            if show_tree:
+                self.screen.blit(self.overlay, (0, 0))
+        else:
+            for rect in restore:
+                self.screen.blit(self.background, rect, rect)
+                if show_tree:
+                    self.screen.blit(self.overlay, rect, rect)
+
+        drawn = []
+        if show_tree:
+            for enemy in enemies:
+                if enemy.path and not enemy.is_recovering:
+                    for i in range(len(enemy.path) - 1):
+                        drawn.append(pygame.draw.line(self.screen, YELLOW, enemy.path[i], enemy.path[i+1], 3))
+
+            drawn.append(pygame.draw.circle(self.screen, GREEN, (int(player.pos.x), int(player.pos.y)), 8, 2))
+            for enemy in enemies:
+                color = ORANGE if enemy.is_recovering else RED
+                drawn.append(pygame.draw.circle(self.screen, color, (int(enemy.pos.x), int(enemy.pos.y)), 8, 2))
+
+        for sprite in [player, *enemies, *collectibles]:
+            drawn.append(self.screen.blit(sprite.image, sprite.rect))
+        drawn.append(self.screen.blit(hud, (10, 10)))
+        if stats is not None:
+            drawn.append(self.screen.blit(stats, (10, 34)))
+
+        if full:
+            pygame.display.flip()
+        else:
+            pygame.display.update(restore + drawn)
+        self.dirty = drawn
+        self.needs_full_redraw = False
+
+    def draw_scrolling(self, player, enemies, collectibles, show_tree, hud, stats):
+        # Everything moves on screen when the view does, so this redraws the whole frame but skips
+        # whatever is outside the view
+        camera = self.camera
+        camera.follow(player.pos)
+        view = camera.view
+        offset = (-view.x, -view.y)
+        self.screen.fill(BLACK)
+        for i in self.obstacle_index.near(view.left, view.top, view.right, view.bottom):
+            obstacle = self.obstacle_sprites[i]
+            self.screen.blit(obstacle.image, obstacle.rect.move(offset))
+
+        if show_tree:
+            left, top, right, bottom = view.left, view.top, view.right, view.bottom
+            trees = {id(enemy.planner.tree): enemy.planner.tree
+                     for enemy in enemies if enemy.planner.tree is not None}
+            for tree in trees.values():
+                for a, b in tree.get_tree_edges():
+                    if (max(a[0], b[0]) >= left and min(a[0], b[0]) < right and
+                            max(a[1], b[1]) >= top and min(a[1], b[1]) < bottom):
+                        pygame.draw.line(self.screen, TREE_EDGE_COLOR, camera.to_screen(a), camera.to_screen(b), 1)
+                for pos in tree.get_node_positions():
+                    if view.collidepoint(pos):
+                        pygame.draw.circle(self.screen, TREE_NODE_COLOR, camera.to_screen(pos), 2)
+            for enemy in enemies:
+                if enemy.path and not enemy.is_recovering:
+                    for a, b in zip(enemy.path, enemy.path[1:]):
+                        pygame.draw.line(self.screen, YELLOW, camera.to_screen(a), camera.to_screen(b), 3)
+            pygame.draw.circle(self.screen, GREEN, camera.to_screen(player.pos), 8, 2)
+            for enemy in enemies:
+                color = ORANGE if enemy.is_recovering else RED
+                pygame.draw.circle(self.screen, color, camera.to_screen(enemy.pos), 8, 2)
+
+        for sprite in [player, *enemies, *collectibles]:
+            if sprite.rect.colliderect(view):
+                self.screen.blit(sprite.image, sprite.rect.move(offset))
+        self.screen.blit(hud, (10, 10))
+        if stats is not None:
+            self.screen.blit(stats, (10, 34))
+        pygame.display.flip()
+        self.dirty = []
+        self.needs_full_redraw = True
+
+# Map generation lives out here so the headless tools build exactly the same maps as the game
+# count and the world size default to the settings above
+def generate_obstacle_rects(count=None, width=None, height=None):
+    count = OBSTACLE_COUNT if count is None else count
+    width = WORLD_WIDTH if width is None else width
+    height = WORLD_HEIGHT if height is None else height
+    placed_obstacles = []
+    attempts = 0
+    max_attempts = max(500, count * 20)
+    
+    while len(placed_obstacles) < count and attempts < max_attempts:
+        w, h = random.randint(60, 120), random.randint(60, 120)
+        x = random.randint(20, width - w - 20)
+        y = random.randint(20, height - h - 20)
+        new_rect = pygame.Rect(x, y, w, h)
+        
+        if (math.hypot(x + w/2 - width//2, y + h/2 - height//2) > 200 and 
+            math.hypot(x + w/2 - 50, y + h/2 - 50) > 200):
+            # Keeps a 15px gap to every placed obstacle, same as checking against each one inflated
+            if new_rect.inflate(30, 30).collidelist(placed_obstacles) == -1:
+                placed_obstacles.append(new_rect)
+        attempts += 1
+    return placed_obstacles
+
+def session_config():
+    """Settings that change how a game plays out, stored with recordings"""
+    return {
+        "pursuit": PURSUIT,
+        "planner": PLANNER,
+        "tree_backend": TREE_BACKEND,
+        "warm_start": WARM_START,
+        "informed": INFORMED_SAMPLING,
+        "adaptive_bias": ADAPTIVE_GOAL_BIAS,
+        "lazy": LAZY_EDGES,
+        "rewire": CONNECT_REWIRE,
+        "max_iterations": MAX_PLAN_ITERATIONS,
+        "async_planning": ASYNC_PLANNING,
+        "planner_workers": PLANNER_WORKERS,
+        "enemy_count": ENEMY_COUNT,
+        "replans_per_frame": REPLANS_PER_FRAME,
+        "replan_trigger": REPLAN_TRIGGER,
+        "replan_distance": REPLAN_DISTANCE,
+        "stuck_replan_frames": STUCK_REPLAN_FRAMES,
+        "level": LEVEL_PATH,
+        "world_width": WORLD_WIDTH,
+        "world_height": WORLD_HEIGHT,
+        "obstacle_count": OBSTACLE_COUNT,
+    }
+
+# One game, minus the drawing. step() advances everything by one tick given the keys held, so the
+# same code runs the window, replays and anything headless. All randomness comes from the seed.
+class Simulation:
+    def __init__(self, seed, config=None, planner_pool=None):
+        self.seed = seed
+        self.config = config or session_config()
+        random.seed(seed)
+        self.tick = 0
+        self.score = 0
+        self.last_spawn_score = 0
+        self.caught = False
+        self.scheduler = ReplanScheduler(self.config["replans_per_frame"])
+        self.planner_pool = planner_pool
+
+        self.all_sprites = pygame.sprite.Group()
+        self.obstacles = pygame.sprite.Group()
+        self.collectibles = pygame.sprite.Group()
+
+        # A level replaces the generated map and spawns, the rest still comes from the seed
+        level_path = self.config.get("level")
+        self.level = levels.load(level_path) if level_path else None
+        if self.level is not None:
+            self.world_size = (self.level.width, self.level.height)
+        else:
+            # Recordings from before the world size was stored get the current settings
+            self.world_size = (self.config.get("world_width", WORLD_WIDTH),
+                               self.config.get("world_height", WORLD_HEIGHT))
+        cache = levels.ArtifactCache(LEVEL_CACHE) if self.level is not None and LEVEL_CACHE else None
+
+        if self.level is not None:
+            rects = self.level.obstacles
+        else:
+            rects = generate_obstacle_rects(self.config.get("obstacle_count", OBSTACLE_COUNT), *self.world_size)
+        for rect in rects:
+            obs = Obstacle(*rect)
+            self.obstacles.add(obs)
+            self.all_sprites.add(obs)
+
+        # Built once per map, everything that moves does its collision checks through this
+        self.obstacle_rects = [obs.rect for obs in self.obstacles]
+        self.collision_map = levels.load_collision_map(self.obstacle_rects, *self.world_size, cache)
+
+        width, height = self.world_size
+        player_spawn = self.level.player_spawn if self.level is not None else (width // 2, height // 2)
+        self.player = Player(*player_spawn, self.collision_map)
+        self.all_sprites.add(self.player)
+
+        kind = self.config["planner"]
+        if cache is not None:
+            levels.load_roadmap(kind, self.collision_map, cache)
+        if planner_pool is not None:
+            planner_pool.set_map(self.collision_map, cache.directory if cache is not None else None)
+        self.flow_field = FlowField(self.collision_map) if self.config.get("pursuit", PURSUIT) == "flowfield" else None
+        if kind == "rrtstar":
+            # Recordings from before a setting was stored get what main.py has now
+            options = {"tree_backend": self.config["tree_backend"], "warm_start": self.config["warm_start"],
+                       "informed": self.config.get("informed", INFORMED_SAMPLING),
+                       "adaptive_bias": self.config.get("adaptive_bias", ADAPTIVE_GOAL_BIAS),
+                       "lazy": self.config.get("lazy", LAZY_EDGES),
+                       "max_iterations": self.config.get("max_iterations", MAX_PLAN_ITERATIONS)}
+        elif kind == "rrtconnect":
+            options = {"warm_start": self.config["warm_start"],
+                       "rewire": self.config.get("rewire", CONNECT_REWIRE),
+                       "max_iterations": self.config.get("max_iterations", MAX_PLAN_ITERATIONS)}
+        else:
+            options = {}
+        count = self.config["enemy_count"]
+        spawns = enemy_spawn_points(count, self.collision_map)
+        if self.level is not None:
+            spawns = self.level.enemy_spawns[:count] + spawns[len(self.level.enemy_spawns):]
+        self.enemies = []
+        for i, (x, y) in enumerate(spawns):
+            enemy = Enemy(x, y, self.collision_map, make_planner(kind, self.collision_map, **options))
+            # Stagger the replans so they don't all happen on the same frame
+            enemy.replan_cooldown = i * enemy.REPLAN_RATE // count
+            enemy.async_planning = self.config["async_planning"]
+            # Recordings made before the trigger was configurable always used the cooldown
+            enemy.replan_trigger = self.config.get("replan_trigger", "cooldown")
+            enemy.replan_distance = self.config.get("replan_distance", REPLAN_DISTANCE)
+            enemy.stuck_replan_frames = self.config.get("stuck_replan_frames", STUCK_REPLAN_FRAMES)
+            enemy.scheduler = self.scheduler
+            enemy.planner_pool = planner_pool
+            enemy.flow_field = self.flow_field
+            self.enemies.append(enemy)
+            self.all_sprites.add(enemy)
+
+        self.spawn_collectibles()
+
+    def spawn_collectibles(self):
         for _ in range(COLLECTIBLE_COUNT):
             attempts = 0
             while attempts < 100:
-                x = random.randint(50, WIDTH - 50)
-                y = random.randint(50, HEIGHT - 50)
+                x = random.randint(50, self.world_size[0] - 50)
+                y = random.randint(50, self.world_size[1] - 50)
                 test_rect = pygame.Rect(x - 10, y - 10, 20, 20)
-                valid = True
-                for obs in obstacles:
-                    if test_rect.colliderect(obs.rect):
-                        valid = False
-                        break
+                valid = test_rect.collidelist(self.obstacle_rects) == -1
                 if valid:
-                    for col in collectibles:
+                    for col in self.collectibles:
                         if math.hypot(x - col.pos.x, y - col.pos.y) < 80:
                             valid = False
                             break
                 if valid:
                     col = Collectible(x, y)
-                    collectibles.add(col)
-                    all_sprites.add(col)
+                    self.collectibles.add(col)
+                    self.all_sprites.add(col)
                     break
                 attempts += 1
 
+    def step(self, keys):
+        self.tick += 1
+        player_speed = PLAYER_SPEED + (self.score // 5) * 0.25
+        enemy_speed = ENEMY_SPEED + (self.score // 5) * 0.5
+
+        self.scheduler.new_frame()
+        # Plans that finished on the pool since last tick get applied before anyone moves
+        if self.planner_pool is not None:
+            self.planner_pool.collect()
+
+        self.player.update(player_speed, keys)
+        if self.flow_field is not None:
+            self.flow_field.update(self.player.pos)
+        for enemy in self.enemies:
+            enemy.update(self.player.pos, enemy_speed)
+
+        if self.planner_pool is not None:
+            self.planner_pool.dispatch()
+
+        hit_collectibles = pygame.sprite.spritecollide(self.player, self.collectibles, True)
+        self.score += len(hit_collectibles)
+
+        if self.score >= self.last_spawn_score + 5:
+            self.spawn_collectibles()
+            self.last_spawn_score = self.score
+
+        if any(self.player.rect.colliderect(enemy.rect) for enemy in self.enemies):
+            self.caught = True
+
+    def cancel_planning(self):
+        for enemy in self.enemies:
+            enemy.cancel_planning()
+
+async def main():
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("RRT* Chase - Optimized Pathfinding")
+    clock = pygame.time.Clock()
+    font = pygame.font.Font(None, 24)
+    title_font = pygame.font.Font(None, 48)
+
+    screen.fill(BLACK)
+    pygame.display.flip()
+
     game_state = "menu"
     show_tree = False
-    score = 0
-    last_spawn_score = 0
 
     # Claude, "Please give me boilerplate of a pygame introduction menu"
     # Usually for my projects I just hand draw these but that didn't make sense here. 
@@ -382,6 +1524,7 @@ async def main():
         instructions = [
             "WASD or Arrow Keys - Move",
             "T - Toggle to see the RRT* Paths",
+            "P - Toggle performance stats",
             "Collect cyan dots to score",
             "Avoid the red enemy!",
             "",
@@ -403,125 +1546,112 @@ async def main():
         
         pygame.display.flip()
 
-    def setup_game():
-        nonlocal score, last_spawn_score
-        score = 0
-        last_spawn_score = 0
-        
-        all_sprites = pygame.sprite.Group()
-        obstacles = pygame.sprite.Group()
-        collectibles = pygame.sprite.Group()
-
-        placed_obstacles = []
-        attempts = 0
-        max_attempts = 500
-        
-        while len(placed_obstacles) < OBSTACLE_COUNT and attempts < max_attempts:
-            w, h = random.randint(60, 120), random.randint(60, 120)
-            x = random.randint(20, WIDTH - w - 20)
-            y = random.randint(20, HEIGHT - h - 20)
-            new_rect = pygame.Rect(x, y, w, h)
-            
-            if (math.hypot(x + w/2 - WIDTH//2, y + h/2 - HEIGHT//2) > 200 and 
-                math.hypot(x + w/2 - 50, y + h/2 - 50) > 200):
-                overlap = False
-                for existing_rect in placed_obstacles:
-                    if new_rect.colliderect(existing_rect.inflate(30, 30)):
-                        overlap = True
-                        break
-                if not overlap:
-                    obs = Obstacle(x, y, w, h)
-                    obstacles.add(obs)
-                    all_sprites.add(obs)
-                    placed_obstacles.append(new_rect)
-            attempts += 1
-
-        player = Player(WIDTH // 2, HEIGHT // 2, obstacles)
-        all_sprites.add(player)
-
-        enemy = Enemy(50, 50, obstacles)
-        all_sprites.add(enemy)
-
-        spawn_collectibles(collectibles, all_sprites, obstacles)
-        return all_sprites, obstacles, collectibles, player, enemy
-
-    all_sprites, obstacles, collectibles, player, enemy = setup_game()
+    def start_game():
+        nonlocal recorder
+        if sim is not None:
+            sim.cancel_planning()
+            save_recording()
+        seed = random.getrandbits(32)
+        game = Simulation(seed, planner_pool=planner_pool)
+        renderer.set_scene(game.obstacles, game.world_size)
+        recorder = Recorder(seed, game.config) if RECORD_PATH else None
+        return game
+
+    def save_recording():
+        if recorder is not None and recorder.ticks:
+            recorder.save(RECORD_PATH.format(seed=recorder.seed))
+
+    renderer = Renderer(screen)
+    planner_pool = make_planner_pool()
+    profiler = make_profiler(record_trace=PROFILE_TRACE is not None)
+    if PROFILE:
+        profiler.enable()
+    sim = None
+    recorder = None
+    lag = 0.0
+    tick_seconds = 1 / TICK_RATE
+    last_frame = time.perf_counter()
 
     # The following is based on publicly available pygame UI boilerplate
 
     running = True
     while running:
+        frame_start = time.perf_counter()
+        frame_seconds = frame_start - last_frame
+        last_frame = frame_start
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_t:
                     show_tree = not show_tree
+                if event.key == pygame.K_p:
+                    profiler.toggle()
                 if event.key == pygame.K_r and game_state == "caught":
                     game_state = "playing"
-                    all_sprites, obstacles, collectibles, player, enemy = setup_game()
+                    sim = start_game()
+                    lag = 0.0
                 if event.key == pygame.K_SPACE and game_state == "menu":
                     game_state = "playing"
-                    all_sprites, obstacles, collectibles, player, enemy = setup_game()
+                    sim = start_game()
+                    lag = 0.0
 
         if game_state == "menu":
             draw_menu()
         elif game_state == "playing":
-            current_player_speed = PLAYER_SPEED + (score // 5) * 0.25
-            current_enemy_speed = ENEMY_SPEED + (score // 5) * 0.5
-            
-            player.update(current_player_speed)
-            enemy.update(player.pos, current_enemy_speed)
-
-            hit_collectibles = pygame.sprite.spritecollide(player, collectibles, True)
-            score += len(hit_collectibles)
-
-            if score >= last_spawn_score + 5:
-                spawn_collectibles(collectibles, all_sprites, obstacles)
-                last_spawn_score = score
-
-            if player.rect.colliderect(enemy.rect):
-                game_state = "caught"
-
-        screen.fill(BLACK)
+            # Run however many fixed ticks the time since the last frame is worth
+            lag = min(lag + frame_seconds, MAX_TICKS_PER_FRAME * tick_seconds)
+            keys = pygame.key.get_pressed()
+            while lag >= tick_seconds:
+                lag -= tick_seconds
+                sim.step(keys)
+                if recorder is not None:
+                    recorder.record(keys, sim)
+                if sim.caught:
+                    game_state = "caught"
+                    save_recording()
+                    recorder = None
+                    break
 
         if game_state == "menu":
+            screen.fill(BLACK)
             draw_menu()
+            renderer.invalidate()
         elif game_state == "playing":
-            if show_tree:
-                for edge in enemy.rrt.get_tree_edges():
-                    pygame.draw.line(screen, (50, 50, 150), edge[0], edge[1], 1)
-                for node in enemy.rrt.nodes:
-                    pygame.draw.circle(screen, (0, 0, 255), (int(node.pos.x), int(node.pos.y)), 2)
-
-            if show_tree and enemy.path and not enemy.is_recovering:
-                for i in range(len(enemy.path) - 1):
-                    pygame.draw.line(screen, YELLOW, enemy.path[i], enemy.path[i+1], 3)
-
-            if show_tree:
-                pygame.draw.circle(screen, GREEN, (int(player.pos.x), int(player.pos.y)), 8, 2)
-                color = ORANGE if enemy.is_recovering else RED
-                pygame.draw.circle(screen, color, (int(enemy.pos.x), int(enemy.pos.y)), 8, 2)
-
-            all_sprites.draw(screen)
-
-            status_text = "Status: RECOVERING" if enemy.is_recovering else "Status: CHASING"
-            info_text = font.render(f"Score: {score} | {status_text} | Press T to see RRT*", True, WHITE)
-            screen.blit(info_text, (10, 10))
+            recovering = any(enemy.is_recovering for enemy in sim.enemies)
+            status_text = "Status: RECOVERING" if recovering else "Status: CHASING"
+            info_text = font.render(f"Score: {sim.score} | {status_text} | Press T to see RRT*", True, WHITE)
+            stats_text = font.render(profiler.hud_line(), True, YELLOW) if profiler.enabled else None
+            render_start = time.perf_counter()
+            # With a planner pool the trees live on the workers, so only the paths show up there
+            renderer.draw(sim.player, sim.enemies, sim.collectibles, show_tree, info_text, stats_text)
+            if profiler.enabled:
+                profiler.add("render", time.perf_counter() - render_start)
 
         else:
+            screen.fill(BLACK)
             game_over_text = title_font.render("CAUGHT!", True, RED)
-            score_text = font.render(f"Final Score: {score}", True, WHITE)
+            score_text = font.render(f"Final Score: {sim.score}", True, WHITE)
             restart_text = font.render("Press R to Restart", True, WHITE)
             
             screen.blit(game_over_text, (WIDTH // 2 - game_over_text.get_width() // 2, HEIGHT // 2 - 100))
             screen.blit(score_text, (WIDTH // 2 - score_text.get_width() // 2, HEIGHT // 2 - 20))
             screen.blit(restart_text, (WIDTH // 2 - restart_text.get_width() // 2, HEIGHT // 2 + 40))
+            pygame.display.flip()
+            renderer.invalidate()
 
-        pygame.display.flip()
+        if profiler.enabled:
+            profiler.end_frame(time.perf_counter() - frame_start)
         clock.tick(60)
 
         await asyncio.sleep(0)
 
+    save_recording()
+    if planner_pool is not None:
+        planner_pool.shutdown()
+    profiler.disable()
+    if PROFILE_TRACE is not None:
+        profiler.export(PROFILE_TRACE)
+
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
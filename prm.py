@@ -0,0 +1,102 @@
+import random
+
+import numpy as np
+
+from graph import GraphPlanner, StaticGraph, path_length
+
+# Multi-query planner. The obstacles never move during a game, so instead of growing a new tree for
+# every replan, a probabilistic roadmap (random free points, each linked to its near neighbours where
+# the straight line between them is clear) is built once per map and shared by every enemy. A replan
+# only links the enemy and the player into it and runs A*, so its cost stays about the same however
+# often enemies replan. The roadmap grows when a query can't be answered yet, and with whatever
+# refine time async planning hands out.
+
+PRM_NODES = 300
+PRM_MAX_NODES = 1200
+PRM_GROW_BATCH = 50
+# Links are only made to nodes this close, and at most PRM_LINKS of the nearest
+PRM_RADIUS = 160
+PRM_LINKS = 10
+# The enemy and the player are linked to whichever of their nearest nodes they can see
+CONNECT_CANDIDATES = 16
+
+class Roadmap(StaticGraph):
+    def __init__(self, collision_map, nodes=PRM_NODES):
+        super().__init__(collision_map)
+        self.grow(nodes)
+
+    def rng(self):
+        # Depends only on the layout and how big the roadmap is, so the game, the pool workers and a
+        # roadmap loaded from a baked level all grow it the same way
+        return random.Random(f"{self.collision_map.rects!r}/{len(self.nodes)}")
+
+    def grow(self, count):
+        """Adds up to count free nodes linked to what's around them, returns how many were added"""
+        count = min(count, PRM_MAX_NODES - len(self.nodes))
+        if count <= 0:
+            return 0
+        rng = self.rng()
+        collision_map = self.collision_map
+        hs = collision_map.half_size
+        new = []
+        # Sampling is cheap next to linking, a few rounds covers maps that are mostly blocked
+        for _ in range(8):
+            need = count - len(new)
+            if need <= 0:
+                break
+            candidates = np.array([(rng.uniform(hs, collision_map.width - hs), rng.uniform(hs, collision_map.height - hs))
+                                   for _ in range(need * 2)])
+            new.extend(map(tuple, candidates[collision_map.points_free(candidates)][:need].tolist()))
+        if not new:
+            return 0
+
+        first = len(self.nodes)
+        self.add_nodes(new)
+        # Every new node against everything before it, new or old
+        pairs = []
+        for j in range(first, len(self.nodes)):
+            dist = np.sqrt(((self.node_array[:j] - self.node_array[j]) ** 2).sum(axis=1))
+            near = np.flatnonzero(dist < PRM_RADIUS)
+            near = near[np.argsort(dist[near], kind="stable")[:PRM_LINKS]]
+            pairs.extend((i, j) for i in near.tolist())
+        self.link(pairs)
+        return len(new)
+
+    def candidates(self, pos):
+        # Only the nearest nodes, checking lines to the whole roadmap would cost more than the search
+        dist = ((self.node_array - (pos[0], pos[1])) ** 2).sum(axis=1)
+        return np.argsort(dist, kind="stable")[:CONNECT_CANDIDATES]
+
+    def smooth(self, points):
+        """Skips every waypoint that the one before it can see past, roadmap paths zigzag otherwise"""
+        result = [points[0]]
+        i = 0
+        while i < len(points) - 1:
+            later = np.array(points[i + 2:], dtype=float).reshape(-1, 2)
+            clear = self.collision_map.paths_clear(np.broadcast_to(points[i], later.shape), later)
+            hits = np.flatnonzero(clear)
+            i = i + 2 + int(hits[-1]) if len(hits) else i + 1
+            result.append(points[i])
+        return result
+
+class PRMPlanner(GraphPlanner):
+    """Planner backend that answers replans with A* on the map's shared roadmap"""
+    graph_class = Roadmap
+
+    def plan_steps(self, start, goal, refine_iterations=0):
+        roadmap = self.tree
+        path = roadmap.shortest_path(start, goal)
+        self.iterations = roadmap.expanded
+        # Not connected yet, grow the roadmap a batch at a time until it is or it's full
+        while path is None and roadmap.grow(PRM_GROW_BATCH):
+            yield None
+            path = roadmap.shortest_path(start, goal)
+            self.iterations += roadmap.expanded
+        yield path
+
+        # Refine time goes into growing the shared roadmap, which shortens later paths for everyone
+        if path is not None and refine_iterations and roadmap.grow(refine_iterations):
+            better = roadmap.shortest_path(start, goal)
+            self.iterations += roadmap.expanded
+            if better is not None and path_length(better) < path_length(path):
+                yield better
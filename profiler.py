@@ -0,0 +1,157 @@
+import collections
+import csv
+import functools
+import json
+import time
+
+# Counters and timers for the hot paths. The methods being measured aren't touched: enable() swaps
+# them for timed wrappers and disable() puts the originals back, so with the profiler off the game
+# runs exactly the code it always did. The game loop only reports frame boundaries and render time.
+
+TRACE_FIELDS = ("frame", "frame_ms", "checks", "plans", "plan_ms")
+
+class Profiler:
+    def __init__(self, timers, planners=(), window=120, record_trace=False):
+        # timers: (class, method name, label) or (class, method name, label, size) where
+        # size(args) gives how many items a call counts for, otherwise each call counts as one.
+        # planners: (class, method name) of plan_steps style generators, timed across all their steps.
+        self.timers = [tuple(t) + (None,) * (4 - len(t)) for t in timers]
+        self.planners = list(planners)
+        self.labels = list(dict.fromkeys(t[2] for t in self.timers))
+        self.originals = []
+        self.enabled = False
+
+        # label -> [calls, seconds] for the frame in progress
+        self.counters = collections.defaultdict(lambda: [0, 0.0])
+        self.plans = []
+        self.frame = 0
+        self.history = collections.deque(maxlen=window)
+        self.plan_history = collections.deque(maxlen=window)
+        self.record_trace = record_trace
+        self.trace = []
+
+    def enable(self):
+        if self.enabled:
+            return
+        for cls, name, label, size in self.timers:
+            self._patch(cls, name, self._timed(label, size, getattr(cls, name)))
+        for cls, name in self.planners:
+            self._patch(cls, name, self._timed_plan(getattr(cls, name)))
+        self.enabled = True
+
+    def disable(self):
+        for cls, name, original in reversed(self.originals):
+            setattr(cls, name, original)
+        self.originals = []
+        self.enabled = False
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def _patch(self, cls, name, wrapper):
+        # Saved from the class's own dict so disable() can't copy an inherited method onto a subclass
+        self.originals.append((cls, name, cls.__dict__[name]))
+        setattr(cls, name, wrapper)
+
+    def _timed(self, label, size, func):
+        counters = self.counters
+        clock = time.perf_counter
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                counter = counters[label]
+                counter[0] += size(args) if size else 1
+                counter[1] += clock() - start
+        return wrapper
+
+    def _timed_plan(self, func):
+        plans = self.plans
+        clock = time.perf_counter
+
+        # A plan may be spread over several frames, this adds up only the time spent inside it
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            steps = func(*args, **kwargs)
+            spent = 0.0
+            while True:
+                start = clock()
+                try:
+                    value = next(steps)
+                except StopIteration:
+                    break
+                finally:
+                    spent += clock() - start
+                yield value
+            plans.append(spent)
+        return wrapper
+
+    def add(self, label, seconds):
+        counter = self.counters[label]
+        counter[0] += 1
+        counter[1] += seconds
+
+    def end_frame(self, frame_seconds):
+        row = {"frame": self.frame, "frame_ms": frame_seconds * 1000}
+        for label in self.labels + [l for l in self.counters if l not in self.labels]:
+            calls, seconds = self.counters.get(label, (0, 0.0))
+            row[f"{label}_calls"] = calls
+            row[f"{label}_ms"] = seconds * 1000
+        row["checks"] = row.get("is_path_clear_calls", 0) + row.get("segments_free_calls", 0)
+        row["plans"] = len(self.plans)
+        row["plan_ms"] = sum(self.plans) * 1000
+
+        self.plan_history.extend(self.plans)
+        self.history.append(row)
+        if self.record_trace:
+            self.trace.append(row)
+        self.counters.clear()
+        self.plans.clear()
+        self.frame += 1
+
+    def summary(self):
+        """Rolling averages over the last window frames"""
+        if not self.history:
+            return None
+        frames = len(self.history)
+        stats = {
+            "frame_ms": sum(r["frame_ms"] for r in self.history) / frames,
+            "frame_ms_max": max(r["frame_ms"] for r in self.history),
+            "checks": sum(r["checks"] for r in self.history) / frames,
+            "plan_ms": sum(self.plan_history) * 1000 / len(self.plan_history) if self.plan_history else 0.0,
+            "plan_ms_max": max(self.plan_history) * 1000 if self.plan_history else 0.0,
+        }
+        for label in ("extend", "rewire", "enemy_update", "render"):
+            stats[f"{label}_ms"] = sum(r.get(f"{label}_ms", 0.0) for r in self.history) / frames
+        return stats
+
+    def hud_line(self):
+        stats = self.summary()
+        if stats is None:
+            return "Profiling..."
+        return (f"frame {stats['frame_ms']:.2f}/{stats['frame_ms_max']:.2f} ms | "
+                f"replan {stats['plan_ms']:.2f}/{stats['plan_ms_max']:.2f} ms | "
+                f"checks/frame {stats['checks']:.0f} | extend {stats['extend_ms']:.2f} "
+                f"rewire {stats['rewire_ms']:.2f} enemies {stats['enemy_update_ms']:.2f} "
+                f"render {stats['render_ms']:.2f} ms")
+
+    def export(self, path):
+        """Writes the recorded frames as JSON if path ends in .json, CSV otherwise"""
+        if path.endswith(".json"):
+            with open(path, "w") as f:
+                json.dump(self.trace, f, indent=1)
+                f.write("\n")
+            return
+        fields = list(TRACE_FIELDS)
+        for row in self.trace:
+            fields.extend(k for k in row if k not in fields)
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields, restval=0)
+            writer.writeheader()
+            writer.writerows(self.trace)
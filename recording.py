@@ -0,0 +1,83 @@
+import json
+
+import pygame
+
+# Session recordings. Everything random in a game comes from the seed, so a seed, the settings
+# and the keys held on every tick are enough to play a game again. Keys are stored as run-length
+# encoded [mask, ticks] pairs, and every CHECKPOINT_TICKS the positions of everything that moves
+# are written down so a replay can tell exactly where it stopped matching.
+
+RECORDING_VERSION = 1
+CHECKPOINT_TICKS = 60
+
+# Bit for each direction, the WASD key and the arrow key do the same thing
+MOVE_KEYS = (
+    (1, (pygame.K_w, pygame.K_UP)),
+    (2, (pygame.K_s, pygame.K_DOWN)),
+    (4, (pygame.K_a, pygame.K_LEFT)),
+    (8, (pygame.K_d, pygame.K_RIGHT)),
+)
+
+class KeyState:
+    """Stands in for pygame.key.get_pressed() when the input is scripted or replayed"""
+    def __init__(self, pressed=()):
+        self.pressed = set(pressed)
+
+    def __getitem__(self, key):
+        return key in self.pressed
+
+def keys_to_mask(keys):
+    return sum(bit for bit, codes in MOVE_KEYS if any(keys[code] for code in codes))
+
+def mask_to_keys(mask):
+    return KeyState(codes[0] for bit, codes in MOVE_KEYS if mask & bit)
+
+def checkpoint(sim):
+    positions = [sim.player.pos] + [enemy.pos for enemy in sim.enemies]
+    return [sim.tick] + [round(v, 3) for pos in positions for v in (pos.x, pos.y)]
+
+class Recorder:
+    def __init__(self, seed, config):
+        self.seed = seed
+        self.config = dict(config)
+        self.runs = []
+        self.checkpoints = []
+        self.ticks = 0
+
+    def record(self, keys, sim):
+        """Call after sim.step(keys)"""
+        mask = keys_to_mask(keys)
+        if self.runs and self.runs[-1][0] == mask:
+            self.runs[-1][1] += 1
+        else:
+            self.runs.append([mask, 1])
+        self.ticks += 1
+        if sim.tick % CHECKPOINT_TICKS == 0:
+            self.checkpoints.append(checkpoint(sim))
+
+    def save(self, path):
+        data = {
+            "version": RECORDING_VERSION,
+            "seed": self.seed,
+            "config": self.config,
+            "ticks": self.ticks,
+            "keys": self.runs,
+            "checkpoints": self.checkpoints,
+        }
+        with open(path, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+            f.write("\n")
+
+def load(path):
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("version") != RECORDING_VERSION:
+        raise ValueError(f"{path}: unsupported recording version {data.get('version')!r}")
+    return data
+
+def iter_keys(data):
+    """KeyState for every recorded tick, in order"""
+    for mask, ticks in data["keys"]:
+        keys = mask_to_keys(mask)
+        for _ in range(ticks):
+            yield keys
@@ -0,0 +1,86 @@
+# Plays back a session saved with RECORD_PATH, headless and as fast as the machine allows. Every
+# checkpoint in the recording is compared with the replay, so a mismatch shows the first tick where
+# they went different ways. --repeat runs it several times and checks they all end the same.
+#
+#   python replay.py session-123.json --repeat 3 --trace replay.csv
+
+import argparse
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import main
+import recording
+
+def replay(data, profiler=None):
+    config = dict(data["config"])
+    # Async slices and the pool depend on timing, a replay always plans synchronously
+    config["async_planning"] = False
+    sim = main.Simulation(data["seed"], config)
+    expected = {c[0]: c for c in data["checkpoints"]}
+    first_divergence = None
+
+    start = time.perf_counter()
+    for keys in recording.iter_keys(data):
+        tick_start = time.perf_counter()
+        sim.step(keys)
+        if profiler is not None:
+            profiler.end_frame(time.perf_counter() - tick_start)
+        if first_divergence is None and sim.tick in expected and recording.checkpoint(sim) != expected[sim.tick]:
+            first_divergence = sim.tick
+        if sim.caught:
+            break
+    elapsed = time.perf_counter() - start
+
+    return {
+        "ticks": sim.tick,
+        "recorded_ticks": data["ticks"],
+        "seconds": elapsed,
+        "speedup": sim.tick / main.TICK_RATE / elapsed if elapsed else None,
+        "score": sim.score,
+        "caught": sim.caught,
+        "first_divergence": first_divergence,
+        "final_state": recording.checkpoint(sim),
+    }
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Replay a recorded session headless")
+    parser.add_argument("recording", help="file written by the game with RECORD_PATH set")
+    parser.add_argument("--repeat", type=int, default=1, help="replay this many times and compare the results")
+    parser.add_argument("--trace", help="write a per-tick profiler trace here (.csv or .json)")
+    return parser.parse_args(argv)
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    data = recording.load(args.recording)
+
+    profiler = None
+    if args.trace:
+        profiler = main.make_profiler(record_trace=True)
+        profiler.enable()
+
+    runs = [replay(data, profiler) for _ in range(args.repeat)]
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.export(args.trace)
+
+    deterministic = all(r["final_state"] == runs[0]["final_state"] for r in runs)
+    matches = all(r["first_divergence"] is None for r in runs)
+    print(json.dumps({
+        "recording": args.recording,
+        "seed": data["seed"],
+        "config": data["config"],
+        "deterministic": deterministic,
+        "matches_recording": matches,
+        "runs": runs,
+    }, indent=2))
+    if not (deterministic and matches):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main_cli()
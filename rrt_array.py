@@ -0,0 +1,330 @@
+import math
+import random
+
+import numpy as np
+import pygame
+
+from sampling import AdaptiveGoalBias, informed_sample
+
+# Same planner as RRTStar in main.py but the tree lives in preallocated NumPy arrays (positions,
+# parent indices and costs) instead of one Python object per node. Nothing is allocated per node,
+# the buffers get reused from one plan to the next, and subtree cost updates and edge extraction
+# are done as array operations. Drop-in for RRTStar as far as Enemy and the renderer care.
+# Every iteration still pays a fixed NumPy call overhead, so it's only about even with RRTStar on
+# small trees and gets ahead once they reach a few hundred nodes.
+
+class ArrayRRTStar:
+    def __init__(self, start_pos, collision_map, max_distance=80, goal_bias=0.3, rewire_radius=150,
+                 adaptive_bias=False, lazy=False, capacity=8192):
+        self.collision_map = collision_map
+        self.max_distance = max_distance
+        self.goal_bias = goal_bias
+        self.adaptive_bias = AdaptiveGoalBias(goal_bias) if adaptive_bias else None
+        self.rewire_radius = rewire_radius
+        # See RRTStar.lazy
+        self.lazy = lazy
+        self.capacity = capacity
+
+        self.pos = np.zeros((capacity, 2))
+        self.parent = np.zeros(capacity, dtype=np.int32)
+        self.cost = np.zeros(capacity)
+        # Whether the edge from a node's parent has been collision checked
+        self.verified = np.ones(capacity, dtype=bool)
+        # Scratch space for the per-iteration distance queries
+        self.scratch = np.zeros(capacity)
+        self.squared = np.zeros(capacity)
+        # See RRTStar.revision
+        self.revision = 0
+        self.reset(start_pos)
+
+    def reset(self, start_pos):
+        self.revision += 1
+        self.root = 0
+        self.count = 1
+        self.pos[0] = (start_pos[0], start_pos[1])
+        # The root is its own parent, keeps every fancy-indexing step in bounds
+        self.parent[0] = 0
+        self.cost[0] = 0
+        self.verified[0] = True
+
+    def __len__(self):
+        return self.count
+
+    def is_position_valid(self, pos):
+        return self.collision_map.is_point_free(pos)
+
+    def is_path_clear(self, start_pos, end_pos):
+        return self.collision_map.is_path_clear(start_pos, end_pos)
+
+    def _squared_distances(self, pos):
+        # One column at a time, for the few hundred nodes of a typical tree this is about twice as
+        # fast as going through an (n, 2) difference array
+        n = self.count
+        squared, scratch = self.squared[:n], self.scratch[:n]
+        np.subtract(self.pos[:n, 0], pos[0], out=squared)
+        np.multiply(squared, squared, out=squared)
+        np.subtract(self.pos[:n, 1], pos[1], out=scratch)
+        np.multiply(scratch, scratch, out=scratch)
+        return np.add(squared, scratch, out=squared)
+
+    def _distances(self, pos):
+        return np.sqrt(self._squared_distances(pos))
+
+    def get_nearby_nodes(self, pos, radius=None):
+        if radius is None:
+            radius = self.rewire_radius
+        return np.flatnonzero(self._squared_distances(pos) < radius * radius)
+
+    def _neighbourhood(self, pos):
+        # get_nearby_nodes plus the distances to them, which it has already worked out
+        nearby = self.get_nearby_nodes(pos)
+        return nearby, np.sqrt(self.squared[nearby])
+
+    def add_node(self, pos, parent, cost, verified=True):
+        if self.count >= self.capacity:
+            return None
+        index = self.count
+        self.pos[index] = (pos[0], pos[1])
+        self.parent[index] = parent
+        self.cost[index] = cost
+        self.verified[index] = verified
+        self.count += 1
+        return index
+
+    def descendants(self, index):
+        # Mask of index and everything below it, spreading one level per pass
+        parent = self.parent[:self.count]
+        mask = np.zeros(self.count, dtype=bool)
+        mask[index] = True
+        size = 1
+        while True:
+            mask |= mask[parent]
+            grown = np.count_nonzero(mask)
+            if grown == size:
+                return mask
+            size = grown
+
+    def rewire(self, new_index, nearby, distances):
+        new_pos = tuple(self.pos[new_index].tolist())
+        new_costs = self.cost[new_index] + distances
+        # Costs only ever go down while rewiring, so anything that fails here would fail later too
+        improves = new_costs < self.cost[nearby]
+        candidates = nearby[improves]
+        if len(candidates) == 0:
+            return
+        ends = self.pos[candidates]
+        if self.lazy:
+            clear = np.ones(len(candidates), dtype=bool)
+        else:
+            clear = self.collision_map.paths_clear(np.broadcast_to(new_pos, ends.shape), ends)
+        for node, new_cost, is_clear in zip(candidates.tolist(), new_costs[improves].tolist(), clear):
+            if is_clear and new_cost < self.cost[node]:
+                # Every descendant's cost drops by the same amount, no need to walk the subtree
+                mask = self.descendants(node)
+                self.cost[:self.count][mask] += new_cost - self.cost[node]
+                self.parent[node] = new_index
+                self.verified[node] = not self.lazy
+                self.revision += 1
+
+    # best_cost works the same as in RRTStar.extend
+    def extend(self, target_pos, max_iterations=1, best_cost=None):
+        hs = self.collision_map.half_size
+        width, height = self.collision_map.width, self.collision_map.height
+        target = (float(target_pos[0]), float(target_pos[1]))
+        for _ in range(max_iterations):
+            bias = self.goal_bias if self.adaptive_bias is None else self.adaptive_bias.value
+            towards_goal = random.random() < bias
+            if towards_goal:
+                sample = target
+            elif best_cost is not None:
+                sample = informed_sample(self.pos[self.root].tolist(), target, best_cost)
+            else:
+                sample = (random.uniform(0, width), random.uniform(0, height))
+
+            # Only the array work is done in NumPy, the per-node scalar maths stays in plain floats
+            nearest = int(np.argmin(self._squared_distances(sample)))
+            nx, ny = self.pos[nearest].tolist()
+
+            dx, dy = sample[0] - nx, sample[1] - ny
+            length = math.hypot(dx, dy)
+            if length > 0:
+                dx, dy = dx / length, dy / length
+            step = min(self.max_distance, length)
+            new_pos = (max(hs, min(width - hs, nx + dx * step)),
+                       max(hs, min(height - hs, ny + dy * step)))
+
+            if self.lazy:
+                extended = self.is_position_valid(new_pos)
+            else:
+                extended = self.is_path_clear((nx, ny), new_pos) and self.is_position_valid(new_pos)
+            if towards_goal and self.adaptive_bias is not None:
+                self.adaptive_bias.update(extended)
+            if extended:
+                edge = math.hypot(new_pos[0] - nx, new_pos[1] - ny)
+                new_index = self.add_node(new_pos, nearest, self.cost[nearest] + edge, not self.lazy)
+                if new_index is None:
+                    return None
+
+                self.rewire(new_index, *self._neighbourhood(new_pos))
+
+                to_goal = math.hypot(target[0] - new_pos[0], target[1] - new_pos[1])
+                if to_goal < self.max_distance:
+                    if (self.lazy or self.is_path_clear(new_pos, target_pos)) and self.is_position_valid(target_pos):
+                        goal_index = self.add_node(target_pos, new_index, self.cost[new_index] + to_goal, not self.lazy)
+                        if goal_index is None:
+                            return None
+                        return self.get_path(goal_index)
+
+        return None
+
+    def get_path(self, index):
+        if self.lazy:
+            index = self.verify_path(index)
+            if index is None:
+                return None
+        # Walk the parent links in plain ints and pull the positions out in one go
+        indices = [index]
+        while index != self.root:
+            index = int(self.parent[index])
+            indices.append(index)
+        indices.reverse()
+        return [pygame.math.Vector2(p) for p in self.pos[indices].tolist()]
+
+    # Same as RRTStar.verify_path, except removing nodes renumbers the rest so the (possibly new)
+    # index of the node is returned, or None if it was dropped
+    def verify_path(self, index):
+        while True:
+            unchecked = []
+            node = index
+            while node != self.root:
+                if not self.verified[node]:
+                    unchecked.append(node)
+                node = int(self.parent[node])
+            if not unchecked:
+                return index
+
+            unchecked = np.array(unchecked)
+            clear = self.collision_map.paths_clear(self.pos[self.parent[unchecked]], self.pos[unchecked])
+            self.verified[unchecked[clear]] = True
+            blocked = unchecked[~clear]
+            if len(blocked) == 0:
+                return index
+            # Closest to the root first, then walk the path again
+            index = self.repair(int(blocked[-1]), index)
+            if index is None:
+                return None
+
+    def repair(self, node, tracked):
+        blocked_parent = self.parent[node]
+        mask = self.descendants(node)
+        nearby = self.get_nearby_nodes(self.pos[node])
+        nearby = nearby[~mask[nearby] & (nearby != blocked_parent)]
+        self.revision += 1
+        if len(nearby):
+            totals = self.cost[nearby] + np.sqrt(((self.pos[nearby] - self.pos[node]) ** 2).sum(axis=1))
+            order = np.argsort(totals, kind="stable")
+            nearby, totals = nearby[order], totals[order]
+            clear = self.collision_map.paths_clear(self.pos[nearby], np.broadcast_to(self.pos[node], (len(nearby), 2)))
+            hits = np.flatnonzero(clear)
+            if len(hits):
+                best = hits[0]
+                self.cost[:self.count][mask] += totals[best] - self.cost[node]
+                self.parent[node] = nearby[best]
+                self.verified[node] = True
+                return tracked
+        return self._remove(mask, tracked)
+
+    def _remove(self, mask, tracked):
+        # Compacts the buffers over the removed nodes, returns tracked's new index
+        keep = np.flatnonzero(~mask)
+        new_index = np.cumsum(~mask) - 1
+        size = len(keep)
+        self.pos[:size] = self.pos[keep]
+        self.cost[:size] = self.cost[keep]
+        self.verified[:size] = self.verified[keep]
+        self.parent[:size] = new_index[self.parent[keep]]
+        self.root = int(new_index[self.root])
+        self.count = size
+        return None if mask[tracked] else int(new_index[tracked])
+
+    def get_tree_edges(self, start=0):
+        children = np.arange(start, self.count)
+        children = children[children != self.root]
+        return np.stack((self.pos[self.parent[children]], self.pos[children]), axis=1)
+
+    def get_node_positions(self, start=0):
+        return self.pos[start:self.count]
+
+    # Same idea as RRTStar.reroot, flip the parent links from the new anchor up to the old root.
+    # There's no leaf pruning here, once the buffers fill past max_nodes the caller just resets.
+    def reroot(self, new_pos, max_nodes=1500):
+        if self.count >= min(max_nodes, self.capacity - 1) or not self.is_position_valid(new_pos):
+            return False
+
+        distances = self._distances(new_pos)
+        anchor = int(np.argmin(distances))
+        if not self.is_path_clear(new_pos, self.pos[anchor]):
+            order = np.argsort(distances, kind="stable")
+            order = order[distances[order] < self.max_distance]
+            anchor = next((int(i) for i in order if self.is_path_clear(new_pos, self.pos[i])), None)
+            if anchor is None:
+                return False
+
+        previous = anchor
+        node = anchor
+        # The checked flags move along with the flipped edges, as in RRTStar.reroot
+        verified = True
+        while node != self.root:
+            parent = int(self.parent[node])
+            self.parent[node] = previous
+            self.verified[node], verified = verified, bool(self.verified[node])
+            previous, node = node, parent
+        self.parent[node] = previous
+        self.verified[node] = verified
+
+        if distances[anchor] > 1e-6:
+            new_root = self.add_node(new_pos, 0, 0)
+            self.parent[anchor] = new_root
+        else:
+            new_root = anchor
+        self.root = new_root
+        self.parent[new_root] = new_root
+        self._recompute_costs()
+        self.revision += 1
+
+        self.rewire(self.root, *self._neighbourhood(self.pos[self.root]))
+        return True
+
+    def _recompute_costs(self):
+        n = self.count
+        parent = self.parent[:n]
+        edges = np.sqrt(((self.pos[:n] - self.pos[parent]) ** 2).sum(axis=1))
+        cost = np.zeros(n)
+        # Settles one more level of the tree per pass
+        while True:
+            updated = cost[parent] + edges
+            if np.array_equal(updated, cost):
+                break
+            cost = updated
+        self.cost[:n] = cost
+
+    def connect_goal(self, target_pos):
+        if not self.is_position_valid(target_pos):
+            return None
+
+        nearby = self.get_nearby_nodes(target_pos, self.max_distance)
+        if len(nearby) == 0:
+            return None
+        target = (target_pos[0], target_pos[1])
+        starts = self.pos[nearby]
+        lengths = np.sqrt(((starts - target) ** 2).sum(axis=1))
+        totals = self.cost[nearby] + lengths
+        clear = self.collision_map.paths_clear(starts, np.broadcast_to(target, starts.shape))
+        for i in np.argsort(totals, kind="stable"):
+            node = int(nearby[i])
+            if clear[i]:
+                goal_index = self.add_node(target_pos, node, totals[i])
+                if goal_index is None:
+                    return None
+                return self.get_path(goal_index)
+        return None
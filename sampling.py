@@ -0,0 +1,47 @@
+import math
+import random
+
+# Sampling helpers shared by both RRT* backends.
+
+def informed_sample(start, goal, best_cost):
+    """Uniform sample from the ellipse of points that could still give a path shorter than best_cost.
+
+    Any point x on a path from start to goal costs at least |x - start| + |goal - x|, so once a path
+    of length best_cost exists only the ellipse with foci start and goal and major axis best_cost
+    can improve it. Returns a plain (x, y) tuple.
+    """
+    sx, sy = start[0], start[1]
+    dx, dy = goal[0] - sx, goal[1] - sy
+    min_cost = math.hypot(dx, dy)
+    # Rounding can leave best_cost a hair under the straight line, treat that as a flat ellipse
+    major = max(best_cost, min_cost) / 2
+    minor = math.sqrt(max(major * major - min_cost * min_cost / 4, 0.0))
+
+    radius = math.sqrt(random.random())
+    angle = random.uniform(0, 2 * math.pi)
+    x, y = major * radius * math.cos(angle), minor * radius * math.sin(angle)
+    if min_cost > 0:
+        cos, sin = dx / min_cost, dy / min_cost
+    else:
+        cos, sin = 1.0, 0.0
+    return sx + dx / 2 + x * cos - y * sin, sy + dy / 2 + x * sin + y * cos
+
+class AdaptiveGoalBias:
+    """Goal bias that follows how often growing straight at the goal has worked lately.
+
+    Open ground makes goal-directed steps succeed and the bias climbs towards high. Behind an
+    obstacle they keep failing, so it drops towards low and leaves more samples for exploring.
+    """
+    def __init__(self, bias, low=0.1, high=0.6, smoothing=0.1):
+        self.low = low
+        self.high = high
+        self.smoothing = smoothing
+        # Starts out at the configured bias
+        self.success = min(1.0, max(0.0, (bias - low) / (high - low)))
+
+    @property
+    def value(self):
+        return self.low + (self.high - self.low) * self.success
+
+    def update(self, succeeded):
+        self.success += self.smoothing * ((1.0 if succeeded else 0.0) - self.success)
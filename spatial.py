@@ -0,0 +1,181 @@
+import math
+
+import numpy as np
+
+# Uniform grid hash over RRT nodes. RRTStar used to scan its whole node list for every nearest
+# and radius query, this keeps the nodes bucketed by cell so a query only looks at nearby cells.
+# Results match the old list scans exactly, ties are broken by insertion order just like min() did.
+
+class SpatialGrid:
+    def __init__(self, cell_size=50):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.order = {}
+        self.counter = 0
+        # Bounding box of occupied cells so ring searches know when to stop
+        self.min_cx = self.min_cy = math.inf
+        self.max_cx = self.max_cy = -math.inf
+
+    def __len__(self):
+        return len(self.order)
+
+    def cell_of(self, pos):
+        return int(math.floor(pos[0] / self.cell_size)), int(math.floor(pos[1] / self.cell_size))
+
+    def insert(self, node):
+        key = self.cell_of(node.pos)
+        self.cells.setdefault(key, []).append(node)
+        self.order[node] = self.counter
+        self.counter += 1
+
+        cx, cy = key
+        self.min_cx = min(self.min_cx, cx)
+        self.max_cx = max(self.max_cx, cx)
+        self.min_cy = min(self.min_cy, cy)
+        self.max_cy = max(self.max_cy, cy)
+
+    def remove(self, node):
+        key = self.cell_of(node.pos)
+        bucket = self.cells.get(key)
+        if bucket is None or node not in self.order:
+            return
+        bucket.remove(node)
+        if not bucket:
+            del self.cells[key]
+        del self.order[node]
+
+    def clear(self):
+        self.cells.clear()
+        self.order.clear()
+        self.min_cx = self.min_cy = math.inf
+        self.max_cx = self.max_cy = -math.inf
+
+    def nearest(self, pos):
+        if not self.order:
+            return None
+
+        cx, cy = self.cell_of(pos)
+        best = None
+        best_dist = math.inf
+        best_order = None
+        # Rings that don't reach the occupied area are empty, start at the first one that does
+        ring = max(0, self.min_cx - cx, cx - self.max_cx, self.min_cy - cy, cy - self.max_cy)
+        while True:
+            for key in self._ring_cells(cx, cy, ring):
+                for node in self.cells.get(key, ()):
+                    dist = node.pos.distance_to(pos)
+                    if dist < best_dist or (dist == best_dist and self.order[node] < best_order):
+                        best, best_dist, best_order = node, dist, self.order[node]
+
+            # Anything in the next ring is at least ring * cell_size away. Strict so equal
+            # distances further out still get compared on insertion order.
+            if best is not None and best_dist < ring * self.cell_size:
+                return best
+            if (cx - ring <= self.min_cx and cx + ring >= self.max_cx and
+                cy - ring <= self.min_cy and cy + ring >= self.max_cy):
+                return best
+            ring += 1
+
+    def within(self, pos, radius):
+        if not self.order:
+            return []
+
+        x, y = pos[0], pos[1]
+        min_cx, min_cy = self.cell_of((x - radius, y - radius))
+        max_cx, max_cy = self.cell_of((x + radius, y + radius))
+        min_cx, max_cx = max(min_cx, self.min_cx), min(max_cx, self.max_cx)
+        min_cy, max_cy = max(min_cy, self.min_cy), min(max_cy, self.max_cy)
+
+        # Same order the old list comprehension over self.nodes returned them in
+        found = []
+        for gx in range(min_cx, max_cx + 1):
+            for gy in range(min_cy, max_cy + 1):
+                for node in self.cells.get((gx, gy), ()):
+                    if node.pos.distance_to(pos) < radius:
+                        found.append(node)
+        found.sort(key=self.order.__getitem__)
+        return found
+
+    def _ring_cells(self, cx, cy, ring):
+        # Cells at Chebyshev distance `ring` from (cx, cy), clipped to the occupied bounding box
+        if ring == 0:
+            yield (cx, cy)
+            return
+        x0, x1 = max(cx - ring, self.min_cx), min(cx + ring, self.max_cx)
+        y0, y1 = max(cy - ring + 1, self.min_cy), min(cy + ring - 1, self.max_cy)
+        for gy in (cy - ring, cy + ring):
+            if self.min_cy <= gy <= self.max_cy:
+                for gx in range(x0, x1 + 1):
+                    yield (gx, gy)
+        for gx in (cx - ring, cx + ring):
+            if self.min_cx <= gx <= self.max_cx:
+                for gy in range(y0, y1 + 1):
+                    yield (gx, gy)
+
+# Uniform grid over axis-aligned boxes (left, top, right, bottom), for maps with far more obstacles
+# than it's worth scanning on every query. Each box is listed in every cell it touches, so a query
+# gets a superset of the boxes that can overlap it and does the exact test itself. Cells outside
+# width x height are folded into the border cells.
+
+class BoxGrid:
+    def __init__(self, boxes, width, height, cell_size=128):
+        self.cell_size = cell_size
+        self.cols = int(width // cell_size) + 1
+        self.rows = int(height // cell_size) + 1
+        cells = [[] for _ in range((self.cols + 2) * (self.rows + 2))]
+        for index, (left, top, right, bottom) in enumerate(boxes):
+            cx0, cy0 = self._cell(left, top)
+            cx1, cy1 = self._cell(right, bottom)
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    cells[self._key(cx, cy)].append(index)
+        self.cells = cells
+        # The same lists flattened for the batched queries, cell k's boxes are ids[offsets[k]:offsets[k + 1]]
+        self.offsets = np.cumsum([0] + [len(c) for c in cells], dtype=np.int64)
+        self.ids = np.array([i for c in cells for i in c], dtype=np.int64)
+
+    def _cell(self, x, y):
+        cx = min(max(int(math.floor(x / self.cell_size)), -1), self.cols)
+        cy = min(max(int(math.floor(y / self.cell_size)), -1), self.rows)
+        return cx, cy
+
+    def _key(self, cx, cy):
+        return (cx + 1) * (self.rows + 2) + cy + 1
+
+    def at(self, x, y):
+        """Boxes listed in the cell containing (x, y)"""
+        return self.cells[self._key(*self._cell(x, y))]
+
+    def near(self, left, top, right, bottom):
+        """Indices of the boxes listed in any cell the area touches, each once"""
+        cx0, cy0 = self._cell(left, top)
+        cx1, cy1 = self._cell(right, bottom)
+        if cx0 == cx1 and cy0 == cy1:
+            return self.cells[self._key(cx0, cy0)]
+        found = set()
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                found.update(self.cells[self._key(cx, cy)])
+        return sorted(found)
+
+    def pairs(self, lefts, tops, rights, bottoms):
+        """Batched near(): (query index, box index) arrays, a pair can repeat if they share several cells"""
+        size = self.cell_size
+        cx0 = np.clip(np.floor(np.asarray(lefts) / size).astype(np.int64), -1, self.cols)
+        cy0 = np.clip(np.floor(np.asarray(tops) / size).astype(np.int64), -1, self.rows)
+        cx1 = np.clip(np.floor(np.asarray(rights) / size).astype(np.int64), -1, self.cols)
+        cy1 = np.clip(np.floor(np.asarray(bottoms) / size).astype(np.int64), -1, self.rows)
+
+        # Every (query, cell) the query touches
+        spans = cy1 - cy0 + 1
+        counts = (cx1 - cx0 + 1) * spans
+        query = np.repeat(np.arange(len(counts)), counts)
+        step = np.arange(len(query)) - np.repeat(np.cumsum(counts) - counts, counts)
+        cell = (cx0[query] + step // spans[query] + 1) * (self.rows + 2) + cy0[query] + step % spans[query] + 1
+
+        # Then every box in those cells
+        starts = self.offsets[cell]
+        counts = self.offsets[cell + 1] - starts
+        query = np.repeat(query, counts)
+        step = np.arange(len(query)) - np.repeat(np.cumsum(counts) - counts, counts)
+        return query, self.ids[np.repeat(starts, counts) + step]
@@ -0,0 +1,156 @@
+# Parameter sweep for the RRT* chaser. Every combination of the values given below is run on every
+# seed and trajectory (the same headless runs as benchmark.py) on a process pool, and the results
+# are folded into one row per combination: how much planning costs and how well the enemy chases.
+#
+#   python sweep.py --goal-bias 0.2,0.35,0.5 --replan-distance 30,60,100 --seeds 20 --output sweep.csv
+
+import argparse
+import csv
+import inspect
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import benchmark
+import main
+
+# The chaser's tree settings are RRTStarPlanner's defaults
+TREE_DEFAULTS = {name: p.default for name, p in inspect.signature(main.RRTStarPlanner).parameters.items()}
+
+# Sweepable setting -> (command line flag, type, current value)
+PARAMETERS = {
+    "goal_bias": ("--goal-bias", float, TREE_DEFAULTS["goal_bias"]),
+    "max_distance": ("--max-distance", float, TREE_DEFAULTS["max_distance"]),
+    "rewire_radius": ("--rewire-radius", float, TREE_DEFAULTS["rewire_radius"]),
+    "replan_rate": ("--replan-rate", int, main.REPLAN_RATE),
+    "replan_distance": ("--replan-distance", float, main.REPLAN_DISTANCE),
+    "max_iterations": ("--max-iterations", int, main.MAX_PLAN_ITERATIONS),
+}
+
+COLUMNS = ("goal_bias", "max_distance", "rewire_radius", "replan_rate", "replan_distance", "max_iterations",
+           "runs", "replans",
+           "plan_ms", "plan_ms_p99", "checks_per_plan", "failed_replans", "path_cost", "catches",
+           "frames_to_catch", "recoveries_per_1k_frames")
+
+def run_job(job):
+    # Runs on a worker process
+    params, seed, trajectory, frames, backend, trigger = job
+    options = {
+        "tree_backend": backend,
+        "goal_bias": params["goal_bias"],
+        "max_distance": params["max_distance"],
+        "rewire_radius": params["rewire_radius"],
+        "max_iterations": params["max_iterations"],
+    }
+    result = benchmark.run(seed, trajectory, frames, "rrtstar", options, params["replan_rate"],
+                           replan_trigger=trigger, replan_distance=params["replan_distance"])
+    # Only what aggregate() needs goes back over the pipe
+    return params, {
+        "frames": frames,
+        "replans": result["replans"],
+        "failed_replans": result["failed_replans"],
+        "latencies": result["_latencies"],
+        "checks": result["collision_checks_per_plan"],
+        "path_cost": result["path_cost"],
+        "catch_intervals": result["_catch_intervals"],
+        "recoveries": result["recoveries"],
+    }
+
+def weighted_mean(pairs):
+    pairs = [(value, weight) for value, weight in pairs if value is not None and weight]
+    total = sum(weight for _, weight in pairs)
+    return sum(value * weight for value, weight in pairs) / total if total else None
+
+def aggregate(params, results):
+    latencies = [t for r in results for t in r["latencies"]]
+    intervals = [t for r in results for t in r["catch_intervals"]]
+    frames = sum(r["frames"] for r in results)
+    row = dict(params)
+    row.update({
+        "runs": len(results),
+        "replans": sum(r["replans"] for r in results),
+        "plan_ms": benchmark.mean(latencies),
+        "plan_ms_p99": benchmark.percentiles(latencies).get("p99"),
+        "checks_per_plan": weighted_mean((r["checks"], r["replans"]) for r in results),
+        "failed_replans": sum(r["failed_replans"] for r in results),
+        "path_cost": weighted_mean((r["path_cost"], r["replans"] - r["failed_replans"]) for r in results),
+        "catches": len(intervals),
+        "frames_to_catch": benchmark.mean(intervals),
+        "recoveries_per_1k_frames": 1000 * sum(r["recoveries"] for r in results) / frames,
+    })
+    return row
+
+def parse_list(kind, text):
+    return [kind(v) for v in text.split(",") if v]
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Sweep the RRT* chaser's tuning parameters")
+    for name, (flag, kind, default) in PARAMETERS.items():
+        parser.add_argument(flag, dest=name, default=str(default),
+                            help=f"comma separated values for {name} (default {default})")
+    parser.add_argument("--seeds", type=int, default=5, help="maps per combination, seeded 0..N-1")
+    parser.add_argument("--frames", type=int, default=1200, help="frames simulated per run")
+    parser.add_argument("--trajectories", default=",".join(benchmark.TRAJECTORIES),
+                        help="comma separated subset of: " + ", ".join(benchmark.TRAJECTORIES))
+    parser.add_argument("--backend", choices=("object", "array"), default=main.TREE_BACKEND)
+    parser.add_argument("--replan-trigger", choices=("events", "cooldown"), default=main.REPLAN_TRIGGER,
+                        help="replan_rate only applies to cooldown, replan_distance only to events")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--sort", default="plan_ms", choices=COLUMNS, help="column to order the table by")
+    parser.add_argument("--output", help="also write the table here, JSON if it ends in .json, CSV otherwise")
+    return parser.parse_args(argv)
+
+def format_table(rows):
+    def cell(value):
+        if value is None:
+            return "-"
+        return f"{value:.3g}" if isinstance(value, float) else str(value)
+    cells = [[cell(row[c]) for c in COLUMNS] for row in rows]
+    widths = [max(len(c), *(len(r[i]) for r in cells)) for i, c in enumerate(COLUMNS)]
+    lines = ["  ".join(c.rjust(w) for c, w in zip(COLUMNS, widths))]
+    lines.extend("  ".join(v.rjust(w) for v, w in zip(r, widths)) for r in cells)
+    return "\n".join(lines)
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    trajectories = [t for t in args.trajectories.split(",") if t]
+    for name in trajectories:
+        if name not in benchmark.TRAJECTORIES:
+            sys.exit(f"unknown trajectory {name!r}")
+
+    values = {name: parse_list(kind, getattr(args, name)) for name, (_, kind, _) in PARAMETERS.items()}
+    grid = [dict(zip(values, combo)) for combo in itertools.product(*values.values())]
+    jobs = [(params, seed, trajectory, args.frames, args.backend, args.replan_trigger)
+            for params in grid for seed in range(args.seeds) for trajectory in trajectories]
+
+    results = {}
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.workers) as pool:
+        for done, (params, result) in enumerate(pool.imap_unordered(run_job, jobs, chunksize=4), 1):
+            results.setdefault(tuple(params.values()), []).append(result)
+            print(f"\r{done}/{len(jobs)} runs", end="", file=sys.stderr, flush=True)
+    print(f"\r{len(jobs)} runs in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    rows = [aggregate(params, results[tuple(params.values())]) for params in grid]
+    rows.sort(key=lambda row: (row[args.sort] is None, row[args.sort]))
+    print(format_table(rows))
+
+    if args.output:
+        if args.output.endswith(".json"):
+            with open(args.output, "w") as f:
+                json.dump(rows, f, indent=2)
+                f.write("\n")
+        else:
+            with open(args.output, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=COLUMNS)
+                writer.writeheader()
+                writer.writerows(rows)
+
+if __name__ == "__main__":
+    main_cli()
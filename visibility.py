@@ -0,0 +1,29 @@
+import itertools
+
+from graph import GraphPlanner, StaticGraph
+
+# Exact planner for this kind of map. Obstacles are a few static axis-aligned rects, so in the
+# inflated configuration space a shortest path only ever bends at the corners of the inflated boxes.
+# Those corners and every clear line between them make a visibility graph. It is built once per map
+# and a replan is just linking the enemy and the player into it and running A*.
+
+# How far outside the inflated boxes the graph's corners sit, keeps them off the blocked boundary
+CORNER_MARGIN = 1.0
+
+class VisibilityGraph(StaticGraph):
+    def __init__(self, collision_map, margin=CORNER_MARGIN):
+        super().__init__(collision_map)
+        corners = []
+        for left, top, right, bottom in collision_map.boxes:
+            for corner in ((left - margin, top - margin), (right + margin, top - margin),
+                           (right + margin, bottom + margin), (left - margin, bottom + margin)):
+                # Corners inside another obstacle or off the map can't be on any path
+                if collision_map.in_bounds(corner) and collision_map.is_point_free(corner):
+                    corners.append(corner)
+        self.add_nodes(corners)
+        self.link(list(itertools.combinations(range(len(corners)), 2)))
+
+class VisibilityGraphPlanner(GraphPlanner):
+    """Planner backend that answers every replan with an A* query on the map's visibility graph.
+    The search is optimal and fast, so there's nothing to spread over frames or refine."""
+    graph_class = VisibilityGraph